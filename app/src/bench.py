@@ -0,0 +1,304 @@
+"""
+bench.py
+
+Benchmarks for map generation, the adversary AI, the fog of war, rendering and whole
+engine steps. Every case is seeded, so runs differ only by the machine. Each case is timed
+over a number of repetitions and reported with its mean, variance and peak traced memory,
+and render cases also with the bytes they wrote.
+
+Results can be saved as a JSON baseline and later runs compared against it: a case fails
+when its time or peak memory grows past the baseline by more than the threshold
+ratios stored in the baseline, or when a render writes more bytes than before. Time is
+compared by the fastest repetition, which noise from the rest of the machine can only
+make slower.
+
+Usage:
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json --only render trail
+"""
+
+import argparse
+import gc
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from distfield import DistanceField
+from engine import RUNNING, GameEngine, RandomPolicy
+from entities import trail_distance_field
+from mapgen import generate_map
+from renderer import Renderer
+from snapshot import encode_snapshot
+
+BASELINE_VERSION = 1
+# Ratios to the baseline past which a case counts as a regression
+THRESHOLDS = {"time": 1.25, "memory": 1.25, "bytes": 1.0}
+# Peaks this small are allocator noise; memory only regresses past this many KB
+MIN_PEAK_KB = 64
+
+# setup() prepares a fresh run() outside the timing; run() returns the bytes it wrote, if any
+Case = namedtuple("Case", "name setup repeat")
+
+WIDTH, HEIGHT, SEED = 300, 300, 7
+# Steps the player walks to lay the synthetic trail, and the first part of the walk that
+# the reveal and render cases replay
+TRAIL_STEPS = 20000
+WALK_STEPS = 1000
+
+_games = {}
+
+
+def _bench_game(walked):
+    """
+    Snapshot of the benchmark game and the player's walk, made once per process. With
+    walked, the player has wandered between random floor tiles for TRAIL_STEPS steps,
+    leaving a long trail through explored fog, and the adversary waits at the start of it.
+    """
+    cached = _games.get(walked)
+    if cached is None:
+        game = GameEngine(WIDTH, HEIGHT, seed=SEED)
+        tiles, player = game.map, game.player
+        start = (player.x, player.y)
+        floor = [(x, y) for y in range(tiles.height) for x in range(tiles.width) if tiles.is_floor(x, y)]
+        rng = random.Random(SEED)
+        walk = [start]
+        while len(walk) <= TRAIL_STEPS:
+            field = DistanceField(tiles, rng.choice(floor))
+            step = field.step_toward(player.x, player.y)
+            while step is not None and len(walk) <= TRAIL_STEPS:
+                player.move(step[0] - player.x, step[1] - player.y, tiles)
+                if walked:
+                    game._reveal_visible_area()
+                walk.append(step)
+                step = field.step_toward(*step)
+        if walked:
+            adversary = game.adversary
+            adversary.x, adversary.y = start
+            adversary.explored.add(start)
+            cached = encode_snapshot(game), walk
+        else:
+            cached = encode_snapshot(GameEngine(WIDTH, HEIGHT, seed=SEED)), walk
+        _games[walked] = cached
+    return cached
+
+
+def _restore(walked):
+    data, walk = _bench_game(walked)
+    return GameEngine.restore(data), walk
+
+
+def _mapgen(width, height, seeds):
+    def setup():
+        def run():
+            for seed in seeds:
+                generate_map(width, height, seed=seed)
+        return run
+    return setup
+
+
+def _adversary_move(starts):
+    # From tiles spread along the walk, move until the adversary reaches the player; it
+    # starts on the trail, so every move looks for trail in sight and follows it
+    def setup():
+        game, walk = _restore(True)
+        adversary, player = game.adversary, game.player
+        goal = (player.x, player.y)
+
+        def run():
+            for adversary.x, adversary.y in walk[:-1:len(walk) // starts]:
+                adversary.route = None
+                # Capped, so a broken trail follower shows up as slow instead of hanging
+                for _ in range(len(walk)):
+                    if (adversary.x, adversary.y) == goal:
+                        break
+                    adversary.move(game, player, game._add_message)
+        return run
+    return setup
+
+
+def _trail_walk(starts):
+    # Follow the trail to the player one _next_trail_step at a time, from tiles spread along the walk
+    def setup():
+        game, walk = _restore(True)
+        adversary, trail, free = game.adversary, game.player.trail, game.map.is_floor
+
+        def run():
+            for adversary.x, adversary.y in walk[::len(walk) // starts]:
+                step = adversary._next_trail_step(trail, free)
+                while step is not None:
+                    adversary.x, adversary.y = step
+                    step = adversary._next_trail_step(trail, free)
+        return run
+    return setup
+
+
+def _trail_field():
+    def setup():
+        game, _ = _restore(True)
+
+        def run():
+            trail_distance_field(game, game.player)
+        return run
+    return setup
+
+
+def _reveal(radius):
+    # Unexplored fog, revealed along the walk
+    def setup():
+        game, walk = _restore(False)
+        game.sight_radius = radius
+        player = game.player
+
+        def run():
+            for player.x, player.y in walk[:WALK_STEPS]:
+                game._reveal_visible_area()
+        return run
+    return setup
+
+
+def _engine_step():
+    # Headless play with random moves, as engine.py --policy random, until the adversary
+    # catches the player; seeded, so every run takes the same steps
+    def setup():
+        game, _ = _restore(False)
+        policy = RandomPolicy(SEED)
+
+        def run():
+            while game.status == RUNNING:
+                game.step(policy(game))
+        return run
+    return setup
+
+
+def _render(frames, minimap=False):
+    # Frames of the player walking through explored fog and trails, drawn into a buffer
+    def setup():
+        game, walk = _restore(True)
+        game.version, game.fps, game.minimap = "bench", 0.0, minimap
+        game.viewport_width, game.viewport_height = 80, 22
+        sink = io.StringIO()
+        renderer = Renderer(sink)
+        player = game.player
+
+        def run():
+            for player.x, player.y in walk[:frames]:
+                renderer.render(game, player, game.adversaries)
+            return sink.tell()
+        return run
+    return setup
+
+
+CASES = [
+    Case("mapgen_80x40", _mapgen(80, 40, range(10)), 20),
+    Case("mapgen_300x300", _mapgen(300, 300, range(5)), 10),
+    Case("mapgen_1000x1000", _mapgen(1000, 1000, range(2)), 5),
+    Case("adversary_move", _adversary_move(20), 10),
+    Case("trail_step", _trail_walk(100), 10),
+    Case("trail_field", _trail_field(), 10),
+    Case("reveal_r2", _reveal(2), 10),
+    Case("reveal_r8", _reveal(8), 10),
+    Case("engine_step", _engine_step(), 10),
+    Case("render", _render(WALK_STEPS), 5),
+    Case("render_minimap", _render(20, minimap=True), 5),
+]
+
+
+def run_case(case, repeat=None):
+    """
+    Time case over its repetitions, then trace one more run for peak memory. As in timeit,
+    garbage collection is off while a run is timed, so its pauses do not land at random.
+    """
+    times = []
+    written = None
+    for _ in range(repeat or case.repeat):
+        run = case.setup()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            written = run()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    run = case.setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {
+        "repeat": len(times),
+        "mean_ms": statistics.mean(times) * 1000,
+        "variance_ms2": statistics.variance(times) * 1e6 if len(times) > 1 else 0.0,
+        "min_ms": min(times) * 1000,
+        "peak_kb": peak / 1024,
+    }
+    if written is not None:
+        result["bytes"] = written
+    return result
+
+
+def compare(results, baseline, thresholds=None):
+    """Lines describing every regression of results against a baseline's cases."""
+    limits = {**THRESHOLDS, **baseline.get("thresholds", {}), **(thresholds or {})}
+    failures = []
+    for name, result in results.items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        for key, limit, unit in (("min_ms", limits["time"], "ms"), ("peak_kb", limits["memory"], "KB"),
+                                 ("bytes", limits["bytes"], "bytes")):
+            if key not in result or key not in base:
+                continue
+            allowed = max(base[key], MIN_PEAK_KB) if key == "peak_kb" else base[key]
+            if result[key] > allowed * limit:
+                failures.append(f"{name}: {key} {result[key]:.1f} {unit} is over {limit:.2f}x "
+                                f"the baseline {base[key]:.1f} {unit}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks and check them against a baseline.")
+    parser.add_argument("--only", nargs="*", default=None, help="run only cases whose names start with these")
+    parser.add_argument("--repeat", type=int, default=None, help="repetitions per case (default: per case)")
+    parser.add_argument("--save", default=None, help="write the results to this JSON baseline")
+    parser.add_argument("--compare", default=None, help="fail on regressions against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=None, help="allowed time ratio to the baseline")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    cases = [c for c in CASES if args.only is None or any(c.name.startswith(p) for p in args.only)]
+
+    results = {}
+    print(f"{'case':<18} {'mean ms':>10} {'variance':>10} {'min ms':>10} {'peak KB':>10} {'bytes':>10}  baseline")
+    for case in cases:
+        result = results[case.name] = run_case(case, args.repeat)
+        base = baseline["cases"].get(case.name) if baseline else None
+        versus = f"{result['min_ms'] / base['min_ms']:.2f}x" if base else ""
+        print(f"{case.name:<18} {result['mean_ms']:>10.2f} {result['variance_ms2']:>10.3f} {result['min_ms']:>10.2f} "
+              f"{result['peak_kb']:>10.0f} {result.get('bytes', ''):>10}  {versus}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"version": BASELINE_VERSION, "python": platform.python_version(),
+                       "thresholds": baseline.get("thresholds", THRESHOLDS) if baseline else THRESHOLDS,
+                       "cases": results}, f, indent=2)
+    if baseline is not None:
+        failures = compare(results, baseline, {"time": args.threshold} if args.threshold else None)
+        for line in failures:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,358 @@
+"""
+bitmap.py
+
+One-bit-per-tile layers aligned with the map (fog of war, trails and similar per-tile flags).
+Bitmap covers a bounded map; SparseBitmap allocates fixed-size pages only where bits are set.
+Both also behave like a set of (x, y) tuples (add, in, len, iteration) so they can stand in
+for the tuple sets entities used to keep. Trail adds visit order and optional decay on top.
+"""
+
+from array import array
+from collections import deque
+from itertools import accumulate
+from math import isqrt
+from operator import add
+
+# Each byte value expanded to eight 0/1 bytes, least significant bit first
+_EXPAND = [bytes((b >> i) & 1 for i in range(8)) for b in range(256)]
+
+
+class Bitmap:
+    """
+    Bit-packed width x height flags; each row starts on a byte boundary.
+
+    With summed=True a SummedArea table is kept alongside, so any_in_rect and
+    count_in_rect answer in constant time for any rectangle size.
+    """
+    def __init__(self, width, height, summed=False):
+        self.width = width
+        self.height = height
+        self.row_stride = (width + 7) >> 3
+        self.bits = bytearray(self.row_stride * height)
+        self.population = 0
+        self.summed = SummedArea(self) if summed else None
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        return (self.bits[y * self.row_stride + (x >> 3)] >> (x & 7)) & 1
+
+    def set(self, x, y):
+        i = y * self.row_stride + (x >> 3)
+        bit = 1 << (x & 7)
+        if not self.bits[i] & bit:
+            self.bits[i] |= bit
+            self.population += 1
+            if self.summed is not None:
+                self.summed.change(x, y, 1)
+
+    def clear(self, x, y):
+        i = y * self.row_stride + (x >> 3)
+        bit = 1 << (x & 7)
+        if self.bits[i] & bit:
+            self.bits[i] &= ~bit & 0xFF
+            self.population -= 1
+            if self.summed is not None:
+                self.summed.change(x, y, -1)
+
+    def row_mask(self, y, x0=0, x1=None):
+        """Bits x0..x1-1 of row y as a bytes object of 0/1 values."""
+        if x1 is None:
+            x1 = self.width
+        start = y * self.row_stride
+        first, last = x0 >> 3, (x1 + 7) >> 3
+        expanded = b''.join([_EXPAND[b] for b in self.bits[start + first:start + last]])
+        offset = x0 - (first << 3)
+        return expanded[offset:offset + x1 - x0]
+
+    def count(self):
+        return self.population
+
+    def count_in_rect(self, x0, y0, x1, y1):
+        """Number of set bits with x0 <= x <= x1 and y0 <= y <= y1, clipped to the map."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return 0
+        if self.summed is not None:
+            return self.summed.count(x0, y0, x1, y1)
+        return sum(self.row_mask(y, x0, x1 + 1).count(1) for y in range(y0, y1 + 1))
+
+    def any_in_rect(self, x0, y0, x1, y1):
+        return self.count_in_rect(x0, y0, x1, y1) > 0
+
+    def bounds(self):
+        """(x0, y0, x1, y1), ends exclusive, enclosing every set bit (not always tightly), or None if none are set."""
+        if not self.population:
+            return None
+        stride = self.row_stride
+        first = len(self.bits) - len(self.bits.lstrip(b'\0'))
+        last = len(self.bits.rstrip(b'\0')) - 1
+        return 0, first // stride, self.width, last // stride + 1
+
+    # Set-of-tuples interface
+    def add(self, pos):
+        self.set(pos[0], pos[1])
+
+    def discard(self, pos):
+        if self.in_bounds(pos[0], pos[1]):
+            self.clear(pos[0], pos[1])
+
+    def __contains__(self, pos):
+        x, y = pos
+        return (0 <= x < self.width and 0 <= y < self.height
+                and ((self.bits[y * self.row_stride + (x >> 3)] >> (x & 7)) & 1) == 1)
+
+    def __len__(self):
+        return self.population
+
+    def __iter__(self):
+        stride = self.row_stride
+        for i, byte in enumerate(self.bits):
+            if byte:
+                y, bx = divmod(i, stride)
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield ((bx << 3) + bit, y)
+
+
+class SummedArea:
+    """
+    Summed-area table over a Bitmap for O(1) rectangle counts.
+
+    Rebuilding the table costs a pass over the map, so single-bit changes are
+    queued per row and added to query results directly. The table is rebuilt, from
+    the first changed row down, once about sqrt(area) changes have piled up, which
+    balances the amortized rebuild cost against the cost of scanning the queue.
+    """
+    def __init__(self, bitmap, max_pending=None):
+        self.bitmap = bitmap
+        self.max_pending = max_pending or max(64, isqrt(bitmap.width * bitmap.height))
+        # rows[y][x] = number of set bits above row y and left of column x
+        self.rows = [array('I', bytes(4 * (bitmap.width + 1)))]
+        # Row -> [(x, delta), ...] changes not yet in the table
+        self.pending = {}
+        self.pending_count = 0
+        self.rebuild()
+
+    def rebuild(self, from_row=0):
+        bitmap = self.bitmap
+        rows = self.rows
+        del rows[from_row + 1:]
+        for y in range(from_row, bitmap.height):
+            prefix = array('I', [0])
+            prefix.extend(accumulate(bitmap.row_mask(y)))
+            rows.append(array('I', map(add, rows[-1], prefix)))
+        self.pending = {}
+        self.pending_count = 0
+
+    def change(self, x, y, delta):
+        self.pending.setdefault(y, []).append((x, delta))
+        self.pending_count += 1
+        if self.pending_count > self.max_pending:
+            self.rebuild(min(self.pending))
+
+    def count(self, x0, y0, x1, y1):
+        rows = self.rows
+        top, bottom = rows[y0], rows[y1 + 1]
+        total = bottom[x1 + 1] - top[x1 + 1] - bottom[x0] + top[x0]
+        pending = self.pending
+        # Visit whichever is fewer: the rows of the query or the rows with queued changes
+        if y1 - y0 < len(pending):
+            changed_rows = (pending[y] for y in range(y0, y1 + 1) if y in pending)
+        else:
+            changed_rows = (changes for y, changes in pending.items() if y0 <= y <= y1)
+        for changes in changed_rows:
+            for x, delta in changes:
+                if x0 <= x <= x1:
+                    total += delta
+        return total
+
+
+class SparseBitmap:
+    """Bitmap for very large maps, stored as page_size x page_size Bitmap pages created on first set."""
+    def __init__(self, width, height, page_size=64):
+        self.width = width
+        self.height = height
+        self.page_size = page_size
+        self.pages = {}
+        self.population = 0
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        px, lx = divmod(x, self.page_size)
+        py, ly = divmod(y, self.page_size)
+        page = self.pages.get((px, py))
+        return page.get(lx, ly) if page is not None else 0
+
+    def set(self, x, y):
+        px, lx = divmod(x, self.page_size)
+        py, ly = divmod(y, self.page_size)
+        page = self.pages.get((px, py))
+        if page is None:
+            page = self.pages[(px, py)] = Bitmap(self.page_size, self.page_size)
+        if not page.get(lx, ly):
+            page.set(lx, ly)
+            self.population += 1
+
+    def clear(self, x, y):
+        px, lx = divmod(x, self.page_size)
+        py, ly = divmod(y, self.page_size)
+        page = self.pages.get((px, py))
+        if page is not None and page.get(lx, ly):
+            page.clear(lx, ly)
+            self.population -= 1
+
+    def row_mask(self, y, x0=0, x1=None):
+        if x1 is None:
+            x1 = self.width
+        size = self.page_size
+        py, ly = divmod(y, size)
+        parts = []
+        x = x0
+        while x < x1:
+            px, lx = divmod(x, size)
+            end = min(x1, (px + 1) * size)
+            page = self.pages.get((px, py))
+            if page is None:
+                parts.append(bytes(end - x))
+            else:
+                parts.append(page.row_mask(ly, lx, lx + end - x))
+            x = end
+        return b''.join(parts)
+
+    def count(self):
+        return self.population
+
+    def count_in_rect(self, x0, y0, x1, y1):
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return 0
+        return sum(self.row_mask(y, x0, x1 + 1).count(1) for y in range(y0, y1 + 1))
+
+    def any_in_rect(self, x0, y0, x1, y1):
+        return self.count_in_rect(x0, y0, x1, y1) > 0
+
+    def bounds(self):
+        # The pages created so far, so the cost follows the explored area rather than the map
+        if not self.population:
+            return None
+        size = self.page_size
+        xs = [px for px, _ in self.pages]
+        ys = [py for _, py in self.pages]
+        return (min(xs) * size, min(ys) * size,
+                min(self.width, (max(xs) + 1) * size), min(self.height, (max(ys) + 1) * size))
+
+    # Set-of-tuples interface
+    def add(self, pos):
+        self.set(pos[0], pos[1])
+
+    def discard(self, pos):
+        self.clear(pos[0], pos[1])
+
+    def __contains__(self, pos):
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height and self.get(x, y) == 1
+
+    def __len__(self):
+        return self.population
+
+    def __iter__(self):
+        size = self.page_size
+        for (px, py), page in self.pages.items():
+            for lx, ly in page:
+                yield (px * size + lx, py * size + ly)
+
+
+def new_bitmap(tiles, summed=False):
+    """Bitmap aligned with a map: flat for bounded maps, paged for very large ones."""
+    if getattr(tiles, "chunk_size", None) is not None:
+        return SparseBitmap(tiles.width, tiles.height, tiles.chunk_size)
+    return Bitmap(tiles.width, tiles.height, summed)
+
+
+class Trail:
+    """
+    Trail store: a bitmap of visited tiles plus an optional age channel.
+
+    The age channel records the order in which tiles were last marked, which is
+    what trail following needs. With decay=N only the tiles marked within the last
+    N marks stay set; older ones are cleared as new marks come in, so a trail's
+    memory and the area an adversary can lock onto stay bounded however long the
+    game runs.
+    """
+    def __init__(self, bits, ages=False, decay=None):
+        self.bits = bits
+        self.width = getattr(bits, "width", None)
+        self.height = getattr(bits, "height", None)
+        self.clock = 0
+        self.decay = decay
+        # Dense stamps for flat bitmaps, a dict for paged bitmaps and plain sets
+        self.dense = isinstance(bits, Bitmap)
+        if ages or decay is not None:
+            self.ages = array('I', bytes(4 * bits.width * bits.height)) if self.dense else {}
+        else:
+            self.ages = None
+        # (stamp, pos) in marking order, only kept for decay; at most `decay` entries
+        self.marks = deque() if decay is not None else None
+
+    def add(self, pos):
+        x, y = pos
+        self.bits.add(pos)
+        if self.ages is None:
+            return
+        self.clock += 1
+        if self.dense:
+            self.ages[y * self.width + x] = self.clock
+        else:
+            self.ages[pos] = self.clock
+        if self.marks is not None:
+            self.marks.append((self.clock, pos))
+            self._expire()
+
+    def stamp(self, x, y):
+        """When (x, y) was last marked (larger is more recent), or None if it is not on the trail."""
+        if self.ages is None or (x, y) not in self.bits:
+            return None
+        return self.ages[y * self.width + x] if self.dense else self.ages[(x, y)]
+
+    def _expire(self):
+        marks = self.marks
+        oldest = self.clock - self.decay
+        while marks and marks[0][0] <= oldest:
+            stamp, pos = marks.popleft()
+            # Skip tiles that were marked again since
+            if self.stamp(*pos) == stamp:
+                self.bits.discard(pos)
+                if not self.dense:
+                    del self.ages[pos]
+
+    def discard(self, pos):
+        self.bits.discard(pos)
+
+    def __contains__(self, pos):
+        return pos in self.bits
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __iter__(self):
+        return iter(self.bits)
+
+    def row_mask(self, y, x0=0, x1=None):
+        return self.bits.row_mask(y, x0, x1)
+
+    def count_in_rect(self, x0, y0, x1, y1):
+        return self.bits.count_in_rect(x0, y0, x1, y1)
+
+    def any_in_rect(self, x0, y0, x1, y1):
+        return self.bits.any_in_rect(x0, y0, x1, y1)
+
+
+def new_trail(tiles, summed=False, ages=False, decay=None):
+    """Trail over a bitmap aligned with the map; see new_bitmap and Trail."""
+    return Trail(new_bitmap(tiles, summed), ages, decay)
@@ -0,0 +1,99 @@
+"""
+distfield.py
+
+Walking-distance fields: the number of steps from one source tile to every open tile of a
+TileMap, found by a breadth-first flood over the padded cell array. DistanceFields keeps
+recent fields in an LRU cache keyed by source, so spawn selection, exit placement and the
+AI can ask about the same sources again without flooding the map each time.
+"""
+
+from array import array
+from collections import OrderedDict
+from tilemap import OPEN_MASK
+
+UNREACHABLE = -1
+
+
+class DistanceField:
+    """Steps from source to every tile, in an array indexed like tiles.cells; -1 where unreachable."""
+    def __init__(self, tiles, source):
+        self.tiles = tiles
+        self.source = source
+        self.dist = _flood(tiles, tiles.index(*source))
+
+    def distance(self, x, y):
+        return self.dist[self.tiles.index(x, y)]
+
+    def step_toward(self, x, y, free=None, within=0):
+        """
+        A neighbor of (x, y) one step closer to the source, or None when (x, y) is within
+        `within` steps of it or cannot reach it. free(x, y), if given, rules out neighbors.
+        """
+        tiles = self.tiles
+        dist = self.dist
+        i = tiles.index(x, y)
+        d = dist[i]
+        if d <= within:
+            return None
+        for offset in tiles.neighbor_offsets:
+            if dist[i + offset] == d - 1:
+                nx, ny = tiles.position(i + offset)
+                if free is None or free(nx, ny):
+                    return nx, ny
+        return None
+
+    def farthest(self, positions):
+        """The reachable position farthest from the source (first one on ties), or None."""
+        best, best_dist = None, UNREACHABLE
+        for x, y in positions:
+            d = self.dist[self.tiles.index(x, y)]
+            if d > best_dist:
+                best, best_dist = (x, y), d
+        return best
+
+
+class DistanceFields:
+    """Distance fields over one map, the `capacity` most recently used kept in memory."""
+    def __init__(self, tiles, capacity=16):
+        self.tiles = tiles
+        self.capacity = capacity
+        self.fields = OrderedDict()
+
+    def field(self, source):
+        field = self.fields.get(source)
+        if field is not None:
+            self.fields.move_to_end(source)
+            return field
+        field = self.fields[source] = DistanceField(self.tiles, source)
+        if len(self.fields) > self.capacity:
+            self.fields.popitem(last=False)
+        return field
+
+    def distance(self, source, target):
+        return self.field(source).distance(*target)
+
+
+def _flood(tiles, start):
+    # Level by level: each pass expands the current frontier list by one step. todo holds
+    # the open tiles not reached yet, so one byte lookup decides whether a neighbor is new.
+    cells = tiles.cells
+    dist = array('i', [UNREACHABLE]) * len(cells)
+    if not cells[start]:
+        return dist
+    todo = bytearray(bytes(cells).translate(OPEN_MASK))
+    east, west, south, north = tiles.neighbor_offsets
+    todo[start] = 0
+    dist[start] = 0
+    frontier = [start]
+    d = 0
+    while frontier:
+        d += 1
+        reached = []
+        for i in frontier:
+            for n in (i + east, i + west, i + south, i + north):
+                if todo[n]:
+                    todo[n] = 0
+                    dist[n] = d
+                    reached.append(n)
+        frontier = reached
+    return dist
@@ -0,0 +1,414 @@
+"""
+engine.py
+
+Headless game core: map, entities, fog, trails and the per-tick rules, driven through
+step(action) and observe() with no terminal I/O, plus simple player policies for driving
+it from code. The interactive Game in game.py is a thin shell around it.
+
+Usage:
+    python engine.py --policy greedy --seed 3 --ticks 50000
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import deque
+from bitmap import new_bitmap, new_trail
+from distfield import DistanceFields
+from mapfile import load_or_generate
+from mapgen import generate_map
+from fov import field_of_view
+from entities import DIRECTIONS, Player, PlayerView, Adversary, AdversarySwarm
+from snapshot import decode_snapshot, journal_path, load_snapshot, save_snapshot
+from tilemap import FLOOR, TileMap
+from tileclass import TileClasses
+from world import ChunkedWorld
+
+RUNNING = "running"
+WON = "won"
+LOST = "lost"
+
+ACTIONS = {"w": (0, -1), "s": (0, 1), "a": (-1, 0), "d": (1, 0)}
+_ACTION_FOR_STEP = {step: action for action, step in ACTIONS.items()}
+
+
+class GameEngine:
+    def __init__(self, map_width, map_height, world="fixed", seed=None, chunk_size=64, chunk_cache=64,
+                 map_cache=False, max_resident=None, adversary_count=1, trail_decay=None,
+                 autosave=None, autosave_interval=1000, sight_radius=2):
+        spawn_radius = None
+        # Only maps asked for by seed go to the cache; every session still gets a seed, drawn
+        # here if none was given, which with the recorded inputs makes it replayable
+        cached = map_cache and seed is not None
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        if world == "chunked":
+            self.map = ChunkedWorld(map_width, map_height, seed, chunk_size, chunk_cache)
+            (px, py), self.exit_pos = self.map.player_start, self.map.exit_pos
+            # Only look for an adversary spawn in the chunks around the player
+            spawn_radius = 2 * chunk_size
+        elif world == "fixed" and cached:
+            # Seeded maps are reused from the on-disk cache instead of being regenerated
+            self.map, (px, py), self.exit_pos = load_or_generate(map_width, map_height, seed, max_resident)
+        elif world == "fixed":
+            self.map, (px, py), self.exit_pos = generate_map(map_width, map_height, seed=seed)
+        else:
+            raise ValueError(f"Unknown world mode: {world}")
+        self.seed = seed
+        self._index_map()
+        # Trails are bitsets sized to the map; with trail_decay=N they keep only the last N marks
+        self.player = Player(px, py, trail=new_trail(self.map, summed=True, ages=True, decay=trail_decay))
+        self.messages = []
+        self.tick = 0
+        self.status = RUNNING
+
+        # FOG OF WAR: tracks which tiles have been seen; paged in chunked mode so it grows with exploration.
+        # visible is the player's current field of view, kept so each move only marks what came into view.
+        self.seen = new_bitmap(self.map)
+        self.sight_radius = sight_radius
+        self.visible = set()
+        self._reveal_visible_area()
+
+        # Adversaries: spawn far from player and spread apart; all of them share one red trail
+        red_trail = new_trail(self.map, decay=trail_decay)
+        spawns = self._find_spawns(px, py, adversary_count, spawn_radius)
+        # Each adversary draws from its own generator, seeded from the game seed
+        self.adversaries = AdversarySwarm(
+            [Adversary(ax, ay, trail=red_trail, explored=new_bitmap(self.map), rng=random.Random(f"{seed}:{i}"))
+             for i, (ax, ay) in enumerate(spawns)], red_trail)
+        self.adversary = self.adversaries[0]
+        self.player_slow_counter = 0
+        self._start_session(autosave, autosave_interval)
+
+    @classmethod
+    def load(cls, path, autosave_interval=1000):
+        """Resume a game from its autosave; the save keeps being updated from there on."""
+        game = cls.__new__(cls)
+        game.status = RUNNING
+        load_snapshot(path, game)
+        game._index_map()
+        game._start_session(path, autosave_interval)
+        return game
+
+    @classmethod
+    def restore(cls, data):
+        """A game from snapshot bytes (see snapshot.encode_snapshot), without autosave."""
+        game = cls.__new__(cls)
+        game.status = RUNNING
+        decode_snapshot(data, game)
+        game._index_map()
+        game._start_session(None, 1000)
+        return game
+
+    def _index_map(self):
+        # Connected regions of a fixed map; chunked worlds are connected by construction
+        self.labels = self.map.label_components()[0] if isinstance(self.map, TileMap) else None
+        # Static dead-end/hallway/junction classes for O(1) hallway checks; fixed maps only
+        self.tile_classes = TileClasses(self.map) if isinstance(self.map, TileMap) else None
+        # Cached walking-distance fields for spawns and the AI; fixed maps only
+        self.distances = DistanceFields(self.map) if isinstance(self.map, TileMap) else None
+
+    def _start_session(self, autosave, autosave_interval):
+        # Autosave writes a snapshot now and every autosave_interval ticks, and a journal record every tick
+        self.autosave = autosave
+        self.autosave_interval = autosave_interval
+        self.journal = save_snapshot(autosave, self) if autosave else None
+        # Session recorder (replay.Recorder) fed every step, if one is attached
+        self.recorder = None
+        # Adversary plans made ahead of time by speculate(): action -> (tick, player tile, plans)
+        self.plans = {}
+
+    def _find_spawns(self, px, py, count, radius=None, spacing=4):
+        """
+        Pick `count` floor tiles reachable from the player, farthest walk first, at least
+        `spacing` tiles apart (Chebyshev) while enough such tiles exist. One pass over the
+        rows collects candidates; spacing is checked against a grid of spacing-sized buckets.
+        Maps without distance fields rank by Manhattan distance within the player's region.
+        """
+        x0, y0, x1, y1 = 0, 0, self.map.width, self.map.height
+        if radius is not None:
+            x0, y0 = max(x0, px - radius), max(y0, py - radius)
+            x1, y1 = min(x1, px + radius + 1), min(y1, py + radius + 1)
+        dist = index = None
+        if self.distances is not None:
+            dist, index = self.distances.field((px, py)).dist, self.map.index
+        candidates = []
+        for y in range(y0, y1):
+            row = self.map.row_codes(y, x0, x1)
+            i = row.find(FLOOR)
+            while i != -1:
+                x = x0 + i
+                if dist is not None:
+                    d = dist[index(x, y)]
+                    if d >= 0:
+                        candidates.append((d, x, y))
+                elif self.same_region((x, y), (px, py)):
+                    candidates.append((abs(x - px) + abs(y - py), x, y))
+                i = row.find(FLOOR, i + 1)
+        if not candidates:
+            return [(0, 0)] * count
+        # Stable sort keeps scan order among equally distant tiles
+        candidates.sort(key=lambda c: -c[0])
+        picked = []
+        buckets = {}
+        for _, x, y in candidates:
+            if len(picked) == count:
+                break
+            bx, by = x // spacing, y // spacing
+            if any(abs(x - ox) < spacing and abs(y - oy) < spacing
+                   for gx in (bx - 1, bx, bx + 1) for gy in (by - 1, by, by + 1)
+                   for ox, oy in buckets.get((gx, gy), ())):
+                continue
+            picked.append((x, y))
+            buckets.setdefault((bx, by), []).append((x, y))
+        # Crowded maps: fill the rest with the farthest unused tiles, then double up
+        if len(picked) < count:
+            used = set(picked)
+            picked.extend([(x, y) for _, x, y in candidates if (x, y) not in used][:count - len(picked)])
+        while len(picked) < count:
+            picked.append(picked[len(picked) % len(candidates)])
+        return picked
+
+    def same_region(self, a, b):
+        if self.labels is None:
+            return True
+        return self.labels[self.map.index(*a)] == self.labels[self.map.index(*b)]
+
+    def step(self, action=None):
+        """
+        Advance one tick with the player taking `action` (a key of ACTIONS, or None to
+        stand still). Returns the game status afterwards.
+        """
+        if self.status != RUNNING:
+            return self.status
+        tick = self.tick
+        moved = False
+        if action is not None:
+            dx, dy = ACTIONS[action]
+            moved = self.player.move(dx, dy, self.map)
+            if moved:
+                self.tick += 1
+            else:
+                self._add_message("You can't walk there.")
+        player = self.player
+        if (player.x, player.y) in self.adversaries.trail:
+            if self.player_slow_counter == 0 and moved:
+                self.player_slow_counter = 1
+                self._add_message("You are slowed by the adversary's trail!")
+            elif self.player_slow_counter > 0:
+                self.player_slow_counter -= 1
+                self._add_message("You are slowed by the adversary's trail!")
+        else:
+            self.player_slow_counter = 0
+        if moved:
+            # The fog only changes when the player does
+            self._reveal_visible_area()
+
+        self._move_adversaries(action, tick)
+
+        if self._check_end() == RUNNING:
+            self.tick += 1
+            if self.journal is not None:
+                self._autosave()
+        if self.recorder is not None:
+            self.recorder.record(self, action)
+        return self.status
+
+    def speculate(self, stop=None):
+        """
+        Plan the adversaries' next tick for every action the player could take, without
+        changing any game state, so that step() only has to apply the matching plan. Meant
+        to run on another thread while waiting for input; stop() is checked between actions
+        to cut it short, and step() must not run until this returns.
+        """
+        self.plans = {}
+        # A step on a decaying trail may also expire an old tile, which PlayerView does not model
+        if self.status != RUNNING or self.player.trail.decay is not None:
+            return
+        player = self.player
+        for action in list(ACTIONS) + [None]:
+            if stop is not None and stop():
+                return
+            pos = (player.x, player.y)
+            if action is not None:
+                dx, dy = ACTIONS[action]
+                if self.map.is_open(player.x + dx, player.y + dy):
+                    pos = (player.x + dx, player.y + dy)
+            self.plans[action] = (self.tick, pos, self.adversaries.plan(self, PlayerView(player, pos)))
+
+    def _move_adversaries(self, action, tick):
+        # Use the plan speculate() made for this action if it still matches, else plan now
+        planned = self.plans.get(action)
+        self.plans = {}
+        player = self.player
+        if planned is not None and planned[0] == tick and planned[1] == (player.x, player.y):
+            self.adversaries.apply(self, planned[2], self._add_message)
+        else:
+            self.adversaries.move(self, player, self._add_message)
+
+    def run(self, policy, max_ticks=None):
+        """Step with actions from policy(engine) until the game ends or max_ticks pass; returns the status."""
+        ticks = 0
+        while self.status == RUNNING and (max_ticks is None or ticks < max_ticks):
+            self.step(policy(self))
+            ticks += 1
+        return self.status
+
+    def observe(self):
+        """Plain-data view of the current state, for policies and tools."""
+        return {
+            "tick": self.tick,
+            "status": self.status,
+            "player": (self.player.x, self.player.y),
+            "exit": self.exit_pos,
+            "adversaries": [(a.x, a.y) for a in self.adversaries],
+            "locked_on": any(a.locked_on for a in self.adversaries),
+            "messages": self.messages[-2:],
+        }
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def _check_end(self):
+        player = self.player
+        if self.adversaries.occupies((player.x, player.y)):
+            self._add_message("You lose! The adversary caught you!")
+            self._end(LOST)
+        elif (player.x, player.y) == self.exit_pos:
+            self._add_message("You found the exit! Congratulations!")
+            self._end(WON)
+        return self.status
+
+    def _end(self, status):
+        self.status = status
+        self._discard_save()
+
+    def _reveal_visible_area(self):
+        visible = field_of_view(self.map, self.player.x, self.player.y, self.sight_radius)
+        # Tiles that stayed in view were marked already
+        seen = self.seen
+        for x, y in visible - self.visible:
+            seen.set(x, y)
+        self.visible = visible
+
+    def _add_message(self, msg):
+        self.messages.append(msg)
+
+    def _autosave(self):
+        if self.tick - self.journal.base_tick >= self.autosave_interval:
+            self.journal.close()
+            self.journal = save_snapshot(self.autosave, self)
+        else:
+            self.journal.record(self)
+
+    def _discard_save(self):
+        # A finished game is not resumed next time
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+            for path in (self.autosave, journal_path(self.autosave)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class RandomPolicy:
+    """Uniformly random moves."""
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.actions = list(ACTIONS)
+
+    def __call__(self, engine):
+        return self.rng.choice(self.actions)
+
+
+class ScriptedPolicy:
+    """Plays a fixed sequence of actions, then stands still."""
+    def __init__(self, actions):
+        self.actions = iter(actions)
+
+    def __call__(self, engine):
+        return next(self.actions, None)
+
+
+class GreedyExitPolicy:
+    """
+    Walks the shortest open path to the exit, ignoring adversaries: downhill on the exit's
+    distance field, or along a path searched once and reused on maps without fields.
+    """
+    def __init__(self):
+        self.path = deque()
+
+    def __call__(self, engine):
+        player = engine.player
+        pos = (player.x, player.y)
+        if engine.distances is not None:
+            step = engine.distances.field(engine.exit_pos).step_toward(*pos)
+            return _ACTION_FOR_STEP[(step[0] - pos[0], step[1] - pos[1])] if step else None
+        if len(self.path) > 1 and self.path[1] == pos:
+            self.path.popleft()
+        if not self.path or self.path[0] != pos:
+            self.path = _shortest_path(engine.map, pos, engine.exit_pos)
+        if len(self.path) < 2:
+            return None
+        x, y = self.path[1]
+        return _ACTION_FOR_STEP[(x - pos[0], y - pos[1])]
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": GreedyExitPolicy,
+}
+
+
+def _shortest_path(tiles, start, goal):
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        cur = queue.popleft()
+        if cur == goal:
+            path = deque()
+            while cur is not None:
+                path.appendleft(cur)
+                cur = parents[cur]
+            return path
+        x, y = cur
+        for dx, dy in DIRECTIONS:
+            n = (x + dx, y + dy)
+            if n not in parents and tiles.is_open(*n):
+                parents[n] = cur
+                queue.append(n)
+    return deque()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the game headless with a scripted player and report speed.")
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--height", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--adversaries", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    engine = GameEngine(args.width, args.height, seed=args.seed, adversary_count=args.adversaries)
+    policy = POLICIES[args.policy]()
+    start = time.perf_counter()
+    steps = 0
+    while engine.status == RUNNING and steps < args.ticks:
+        engine.step(policy(engine))
+        steps += 1
+    elapsed = time.perf_counter() - start
+    print(f"{engine.status} after {steps} steps in {elapsed:.3f}s ({steps / elapsed:.0f} steps/s)")
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,26 +5,49 @@ Defines Player and Adversary classes, including movement, trail tracking, explor
 """
 
 import random
-from collections import deque
+from collections import deque, namedtuple
+from bitmap import Trail
+from fov import field_of_view
+
+DIRECTIONS = [(1,0),(-1,0),(0,1),(0,-1)]
+
+# Adversaries with nothing left to explore wander within this many steps of the exit
+GUARD_RADIUS = 8
+
+# One adversary's decision for a tick: the tile to step to (None to stay), the state it leaves
+# behind, the route to keep, the random generator state after any draws, and a message to show
+MovePlan = namedtuple("MovePlan", "step mode last_dir locked_on in_hallway route rng_state message")
 
 class Entity:
     """Base class for all moving entities."""
-    def __init__(self, x, y):
+    def __init__(self, x, y, trail=None, explored=None):
         self.x = x
         self.y = y
-        self.trail = set()
+        # Any set-like container of (x, y) works; the game passes map-aligned bitmaps
+        self.trail = trail if trail is not None else set()
         self.trail.add((x, y))
-        self.explored = set()
+        self.explored = explored if explored is not None else set()
         self.explored.add((x, y))
 
 class Player(Entity):
     """Player character: handles movement."""
-    def move(self, dx, dy, game_map, is_open_tile):
+    def __init__(self, x, y, trail=None):
+        # The trail must carry visit order (a Trail with an age channel): adversaries follow it
+        # toward later stamps. The trail is one continuous walk, so every tile except the
+        # player's own has a neighbor with a later stamp.
+        if trail is None:
+            trail = Trail(set(), ages=True)
+        # Every tile the player explored is on its trail, so one store serves both
+        super().__init__(x, y, trail, explored=trail)
+        self.steps = 0
+
+    def move(self, dx, dy, game_map):
         nx, ny = self.x + dx, self.y + dy
-        if is_open_tile(game_map, nx, ny):
+        # The map's wall border makes a one-step probe from an in-map tile safe without bounds checks
+        if game_map.is_open(nx, ny):
             self.x, self.y = nx, ny
             self.trail.add((self.x, self.y))
-            self.explored.add((self.x, self.y))
+            self.steps += 1
             return True
         return False
 
@@ -32,111 +55,354 @@ class Adversary(Entity):
     """
     Adversary: explores the map, leaves a red trail, and robustly locks onto the player via their trail.
     """
-    def __init__(self, x, y, vision_radius=2):
-        super().__init__(x, y)
+    def __init__(self, x, y, vision_radius=2, trail=None, search_limit=4096, explored=None, rng=None):
+        super().__init__(x, y, trail, explored)
         self.mode = "explore"
         self.last_dir = (0, 0)
         self.locked_on = False
         self.in_hallway = False
         self.vision_radius = vision_radius
+        # Explored tiles that still border unexplored floor; built on the first move, when the map is known
+        self.frontier = None
+        # Cached route (deque of tiles) to a frontier tile, and the most tiles one route search may visit
+        self.route = None
+        self.search_limit = search_limit
+        # Own random generator, so planning can work on a copy of it and seeded games repeat
+        self.rng = rng if rng is not None else random.Random()
 
-    def move(self, game, player_trail, player_pos, is_floor, add_message):
-        # 1. Robust Lock-On: BFS from adversary to player along green trail tiles
-        vision_trails = []
-        for dx in range(-self.vision_radius, self.vision_radius + 1):
-            for dy in range(-self.vision_radius, self.vision_radius + 1):
-                tx, ty = self.x + dx, self.y + dy
-                if (tx, ty) in player_trail and is_floor(game.map, tx, ty):
-                    vision_trails.append((tx, ty))
-        lockon_path = None
-        if vision_trails:
-            lockon_path = self._find_trail_path_to_player(game, player_trail, player_pos, is_floor)
-        if lockon_path and len(lockon_path) > 1:
-            if not self.locked_on:
-                add_message("You feel a chill... something is following your trail!")
-            self.locked_on = True
-            self.x, self.y = lockon_path[1]
-            self.last_dir = (lockon_path[1][0] - lockon_path[0][0], lockon_path[1][1] - lockon_path[0][1])
-            self.mode = "trail_follow"
-            self.trail.add((self.x, self.y))
-            self.explored.add((self.x, self.y))
-            return
-        else:
-            self.locked_on = False
-
-        # 2. Hallway following: detect 1-tile-wide gaps/hallways and follow them
-        if self._in_hallway(game, is_floor):
-            self.in_hallway = True
+    def sees_trail(self, tiles, player):
+        r = self.vision_radius
+        trail = player.trail
+        # The player's trail bitmap answers "any trail tile in this square" without a per-tile scan;
+        # only when it does is line of sight worked out, to drop tiles hidden behind walls
+        if not trail.any_in_rect(self.x - r, self.y - r, self.x + r, self.y + r):
+            return False
+        return any(pos in trail for pos in field_of_view(tiles, self.x, self.y, r))
+
+    def move(self, game, player, add_message, trail_field=None, blocked=(), sees_trail=None):
+        """
+        Take one step. trail_field, if given, is a shared distance-from-player map over the
+        green trail used in place of the trail stamps; blocked holds tiles this adversary
+        must not enter (other adversaries); sees_trail passes in an already computed
+        sees_trail(game.map, player).
+        """
+        self.apply(game, self.plan(game, player, trail_field, blocked, sees_trail), add_message)
+
+    def plan(self, game, player, trail_field=None, blocked=(), sees_trail=None):
+        """
+        Decide this tick's move without changing the adversary, its trail or the game.
+        Takes the same arguments as move(); the returned MovePlan is carried out by apply().
+        """
+        tiles = game.map
+        if self.frontier is None:
+            self.frontier = set()
+            self._update_frontier(tiles, self.x, self.y)
+
+        def free(nx, ny):
+            return tiles.is_floor(nx, ny) and (nx, ny) not in blocked
+
+        # 1. Robust Lock-On: follow the green trail forward toward the player
+        step = None
+        if sees_trail is None:
+            sees_trail = self.sees_trail(tiles, player)
+        if sees_trail and game.same_region((self.x, self.y), (player.x, player.y)):
+            if trail_field is not None:
+                step = self._field_step(trail_field, free)
+            else:
+                step = self._next_trail_step(player.trail, free)
+        if step:
+            message = None if self.locked_on else "You feel a chill... something is following your trail!"
+            return MovePlan(step, "trail_follow", (step[0] - self.x, step[1] - self.y), True,
+                            self.in_hallway, self.route, None, message)
+
+        # 2. Hallway following: detect 1-tile-wide gaps/hallways and follow them,
+        # unless already travelling a route to the frontier
+        in_hallway = self.in_hallway
+        ahead = self._hallway_run(game) if not self.route and self.last_dir != (0, 0) else None
+        if ahead is not None:
             dx, dy = self.last_dir
             nx, ny = self.x + dx, self.y + dy
-            if is_floor(game.map, nx, ny):
-                self.x, self.y = nx, ny
-                self.trail.add((self.x, self.y))
-                self.explored.add((self.x, self.y))
-                return
-            else:
-                # At the end of hallway, pick new direction
-                self.in_hallway = False
+            if ahead and (nx, ny) not in blocked:
+                return MovePlan((nx, ny), self.mode, self.last_dir, False, True, self.route, None, None)
+            # At the end of hallway, pick new direction
+            in_hallway = False
 
         # 3. Exploration: seek adjacent unexplored floor tiles
-        for dx, dy in [(1,0),(-1,0),(0,1),(0,-1)]:
+        for dx, dy in DIRECTIONS:
             nx, ny = self.x + dx, self.y + dy
-            if is_floor(game.map, nx, ny) and (nx, ny) not in self.explored:
-                self.x, self.y = nx, ny
-                self.last_dir = (dx, dy)
-                self.mode = "explore"
-                self.trail.add((self.x, self.y))
-                self.explored.add((self.x, self.y))
-                return
-
-        # 4. If all neighbors explored, pick random direction (can backtrack)
-        dirs = [(1,0),(-1,0),(0,1),(0,-1)]
-        random.shuffle(dirs)
+            if free(nx, ny) and (nx, ny) not in self.explored:
+                return MovePlan((nx, ny), "explore", (dx, dy), False, in_hallway, self.route, None, None)
+
+        # 4. All neighbors explored: head for the nearest frontier tile along a cached route
+        route, step = self._frontier_step(free)
+        if step:
+            return MovePlan(step, "frontier", (step[0] - self.x, step[1] - self.y), False,
+                            in_hallway, route, None, None)
+
+        # 5. Nothing left to explore within reach: patrol back toward the exit, which the player
+        # has to reach sooner or later, along its cached walking-distance field
+        distances = getattr(game, "distances", None)
+        if distances is not None:
+            step = distances.field(game.exit_pos).step_toward(self.x, self.y, free, GUARD_RADIUS)
+            if step:
+                return MovePlan(step, "explore", (step[0] - self.x, step[1] - self.y), False,
+                                in_hallway, route, None, None)
+
+        # Near the exit, or no distance fields: pick random direction (can backtrack).
+        # The shuffle draws from a copy of the generator so planning leaves it untouched.
+        rng = random.Random()
+        rng.setstate(self.rng.getstate())
+        dirs = list(DIRECTIONS)
+        rng.shuffle(dirs)
         for dx, dy in dirs:
             nx, ny = self.x + dx, self.y + dy
-            if is_floor(game.map, nx, ny):
-                self.x, self.y = nx, ny
-                self.last_dir = (dx, dy)
-                self.mode = "explore"
-                self.trail.add((self.x, self.y))
-                self.explored.add((self.x, self.y))
-                return
-
-    def _find_trail_path_to_player(self, game, player_trail, player_pos, is_floor):
-        # BFS from adversary to player, only traversing green trail tiles
-        queue = deque()
-        visited = set()
-        prev = {}
+            if free(nx, ny):
+                return MovePlan((nx, ny), "explore", (dx, dy), False, in_hallway, route, rng.getstate(), None)
+        return MovePlan(None, self.mode, self.last_dir, False, in_hallway, route, rng.getstate(), None)
+
+    def apply(self, game, plan, add_message):
+        """Carry out a MovePlan made by plan() for the current tick."""
+        if plan.message:
+            add_message(plan.message)
+        self.locked_on = plan.locked_on
+        self.in_hallway = plan.in_hallway
+        self.mode = plan.mode
+        self.last_dir = plan.last_dir
+        self.route = plan.route
+        if plan.rng_state is not None:
+            self.rng.setstate(plan.rng_state)
+        if plan.step is not None:
+            if plan.mode == "frontier" and plan.route:
+                # A frontier step is the head of the route (hallway steps keep the old mode, but have no route)
+                self.route.popleft()
+            self._visit(game.map, *plan.step)
+
+    def rebuild_frontier(self, tiles):
+        """Recompute the frontier from the explored tiles, e.g. after restoring a saved game."""
+        self.frontier = {(x, y) for x, y in self.explored if self._borders_unexplored(tiles, x, y)}
+        self.route = None
+
+    def _visit(self, tiles, nx, ny):
+        self.x, self.y = nx, ny
+        self.trail.add((nx, ny))
+        if (nx, ny) not in self.explored:
+            self.explored.add((nx, ny))
+            self._update_frontier(tiles, nx, ny)
+
+    def _update_frontier(self, tiles, x, y):
+        # Exploring (x, y) can only add (x, y) itself to the frontier, or take off
+        # neighbors that were on it only because of (x, y)
+        frontier = self.frontier
+        if self._borders_unexplored(tiles, x, y):
+            frontier.add((x, y))
+        for dx, dy in DIRECTIONS:
+            n = (x + dx, y + dy)
+            if n in frontier and not self._borders_unexplored(tiles, n[0], n[1]):
+                frontier.discard(n)
+
+    def _borders_unexplored(self, tiles, x, y):
+        explored = self.explored
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if tiles.is_floor(nx, ny) and (nx, ny) not in explored:
+                return True
+        return False
+
+    def _frontier_step(self, free):
+        # Returns (route to keep, next step). The route stays valid while it starts next to us
+        # and still ends on a frontier tile; anything else (the target got explored, a lock-on
+        # pulled us away) triggers a new search. The caller pops the step off once taken.
+        route = self.route
+        if not (route and abs(route[0][0] - self.x) + abs(route[0][1] - self.y) == 1
+                and route[-1] in self.frontier):
+            route = self._route_to_frontier() if self.frontier else None
+        if not route:
+            return route, None
+        if not free(*route[0]):
+            # Another adversary is in the way; search again next time
+            return None, None
+        return route, route[0]
+
+    def _route_to_frontier(self):
+        # Breadth-first over explored tiles only: every frontier tile is explored and the explored
+        # tiles form one connected walk, so the search never needs to look at unknown ground.
         start = (self.x, self.y)
-        queue.append(start)
-        visited.add(start)
-        while queue:
-            cx, cy = queue.popleft()
-            if (cx, cy) == player_pos:
-                path = [(cx, cy)]
-                while (cx, cy) != start:
-                    cx, cy = prev[(cx, cy)]
-                    path.append((cx, cy))
-                path.reverse()
-                return path
-            for dx, dy in [(1,0),(-1,0),(0,1),(0,-1)]:
-                nx, ny = cx + dx, cy + dy
-                if (
-                    (nx, ny) not in visited and
-                    (nx, ny) in player_trail and
-                    is_floor(game.map, nx, ny)
-                ):
-                    visited.add((nx, ny))
-                    prev[(nx, ny)] = (cx, cy)
-                    queue.append((nx, ny))
+        explored = self.explored
+        frontier = self.frontier
+        parents = {start: None}
+        queue = deque([start])
+        while queue and len(parents) <= self.search_limit:
+            cur = queue.popleft()
+            if cur in frontier and cur != start:
+                route = deque()
+                while cur != start:
+                    route.appendleft(cur)
+                    cur = parents[cur]
+                return route
+            x, y = cur
+            for dx, dy in DIRECTIONS:
+                n = (x + dx, y + dy)
+                if n not in parents and n in explored:
+                    parents[n] = cur
+                    queue.append(n)
         return None
 
-    def _in_hallway(self, game, is_floor):
-        # A hallway/gap is a 1-tile-wide passage: surrounded by walls except front/back
+    def _next_trail_step(self, trail, free):
+        # Step to the adjacent trail tile the player visited most recently. Stamps only grow
+        # along the player's walk, so repeating this reaches the player and skips any loops
+        # in the trail; each call looks at four neighbors instead of searching the whole trail.
+        best = None
+        best_stamp = trail.stamp(self.x, self.y)
+        if best_stamp is None:
+            best_stamp = -1
+        for dx, dy in DIRECTIONS:
+            nx, ny = self.x + dx, self.y + dy
+            stamp = trail.stamp(nx, ny)
+            if stamp is not None and stamp > best_stamp and free(nx, ny):
+                best, best_stamp = (nx, ny), stamp
+        return best
+
+    def _field_step(self, trail_field, free):
+        # Step to the adjacent tile closest to the player along the trail
+        best = None
+        best_dist = trail_field.get((self.x, self.y), float("inf"))
+        for dx, dy in DIRECTIONS:
+            nx, ny = self.x + dx, self.y + dy
+            dist = trail_field.get((nx, ny))
+            if dist is not None and dist < best_dist and free(nx, ny):
+                best, best_dist = (nx, ny), dist
+        return best
+
+    def _hallway_run(self, game):
+        # None when not in a hallway, else how many tiles the hallway continues along last_dir
+        classes = getattr(game, "tile_classes", None)
+        if classes is not None:
+            if not classes.in_hallway(self.x, self.y):
+                return None
+            return classes.run_length(self.x, self.y, self.last_dir)
+        if not self._in_hallway(game):
+            return None
+        dx, dy = self.last_dir
+        return 1 if game.map.is_floor(self.x + dx, self.y + dy) else 0
+
+    def _in_hallway(self, game):
+        # A hallway/gap is a 1-tile-wide passage: surrounded by walls except front/back.
+        # Only used for maps without precomputed tile classes (chunked and paged worlds).
+        tiles = game.map
         wall_count = 0
-        for dx, dy in [(1,0),(-1,0),(0,1),(0,-1)]:
+        for dx, dy in DIRECTIONS:
             nx, ny = self.x + dx, self.y + dy
-            if not is_floor(game.map, nx, ny):
+            if not tiles.is_floor(nx, ny):
                 wall_count += 1
         return wall_count >= 2  # 1-tile passage
 
+
+
+class AdversarySwarm:
+    """
+    A group of adversaries sharing one red trail and, each tick, one distance field.
+
+    The field is the breadth-first distance from the player along the green trail. It is
+    built at most once per tick, only when some adversary can see the trail, and every
+    locked-on adversary reads its step from it, so a tick costs one trail flood plus O(1)
+    per adversary. A lone adversary keeps using the trail stamps and needs no field.
+    """
+    def __init__(self, adversaries, trail):
+        self.adversaries = list(adversaries)
+        self.trail = trail
+        self.positions = {(a.x, a.y) for a in self.adversaries}
+
+    def __len__(self):
+        return len(self.adversaries)
+
+    def __iter__(self):
+        return iter(self.adversaries)
+
+    def __getitem__(self, i):
+        return self.adversaries[i]
+
+    def occupies(self, pos):
+        return pos in self.positions
+
+    def move(self, game, player, add_message):
+        self.apply(game, self.plan(game, player), add_message)
+
+    def plan(self, game, player):
+        """
+        Plan every adversary's move for this tick without changing anything; player may be a
+        PlayerView of a move the player has not made yet. Returns one MovePlan per adversary.
+        """
+        field = None
+        shared = len(self.adversaries) > 1
+        occupied = set(self.positions)
+        plans = []
+        for adversary in self.adversaries:
+            sees = adversary.sees_trail(game.map, player)
+            if shared and field is None and sees:
+                field = trail_distance_field(game, player)
+            # Adversaries never stack: each one treats the others' (planned) tiles as blocked
+            occupied.discard((adversary.x, adversary.y))
+            plan = adversary.plan(game, player, field, occupied, sees)
+            occupied.add(plan.step or (adversary.x, adversary.y))
+            plans.append(plan)
+        return plans
+
+    def apply(self, game, plans, add_message):
+        messages = []
+        positions = self.positions
+        for adversary, plan in zip(self.adversaries, plans):
+            positions.discard((adversary.x, adversary.y))
+            adversary.apply(game, plan, messages.append)
+            positions.add((adversary.x, adversary.y))
+        # Report each distinct message once per tick rather than once per adversary
+        for msg in dict.fromkeys(messages):
+            add_message(msg)
+
+
+class PlayerView:
+    """
+    How the player looks to the adversaries after stepping to pos, before the step is made:
+    standing on pos with pos freshly stamped on the trail. Used to plan ahead for a key that
+    has not been pressed yet. Trails with decay are not modelled, since the step could also
+    expire an old tile.
+    """
+    def __init__(self, player, pos):
+        self.x, self.y = pos
+        self.trail = player.trail if pos == (player.x, player.y) else _SteppedTrail(player.trail, pos)
+
+
+class _SteppedTrail:
+    # Read-only view of a trail with one more mark at pos
+    def __init__(self, trail, pos):
+        self.trail = trail
+        self.pos = pos
+        self.clock = trail.clock + 1
+
+    def stamp(self, x, y):
+        return self.clock if (x, y) == self.pos else self.trail.stamp(x, y)
+
+    def __contains__(self, pos):
+        return pos == self.pos or pos in self.trail
+
+    def any_in_rect(self, x0, y0, x1, y1):
+        x, y = self.pos
+        return x0 <= x <= x1 and y0 <= y <= y1 or self.trail.any_in_rect(x0, y0, x1, y1)
+
+
+def trail_distance_field(game, player):
+    """Breadth-first distance from the player to every floor tile reachable along the green trail."""
+    tiles = game.map
+    trail = player.trail
+    start = (player.x, player.y)
+    dist = {start: 0}
+    queue = deque([start])
+    while queue:
+        cur = queue.popleft()
+        x, y = cur
+        d = dist[cur] + 1
+        for dx, dy in DIRECTIONS:
+            n = (x + dx, y + dy)
+            if n not in dist and n in trail and tiles.is_floor(n[0], n[1]):
+                dist[n] = d
+                queue.append(n)
+    return dist
@@ -0,0 +1,120 @@
+"""
+fov.py
+
+Line-of-sight field of view by recursive shadowcasting, shared by the player's fog of war
+and the adversaries' vision. Walls block sight but are visible themselves.
+
+The slopes and offsets every octant scan needs depend only on the radius, so they are
+worked out once per radius into a table. A cast reads the square of tiles around the
+viewer into one flat patch, and since what is visible depends only on that patch, the
+result is kept per patch and reused wherever the same surroundings come up again.
+"""
+
+from tilemap import WALL
+
+# (xx, xy, yx, yy): maps an octant's (column, row) offsets onto the map's (dx, dy)
+OCTANTS = [
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1),
+]
+
+_tables = {}
+# Visible offsets by patch (see _patch); the patch's length also tells the radius apart
+_views = {}
+MAX_CACHED_VIEWS = 4096
+# bytes.translate table for the patch of tiles around the viewer: 1 for walls, 2 for open
+# tiles and 0 for the _OFF_MAP filler
+_OFF_MAP = b"\xff"
+_PATCH_CODES = bytes(0 if code == _OFF_MAP[0] else 1 if code == WALL else 2 for code in range(256))
+
+
+def octant_tables(radius):
+    """
+    For each octant, one list per distance 1..radius of (dx, dy, left slope, right slope,
+    inside, k) cells in scan order; inside is False for cells past the round radius, and
+    k is the cell's index in the (2 * radius + 1)-wide square patch centered on the viewer.
+    """
+    tables = _tables.get(radius)
+    if tables is None:
+        limit = radius * (radius + 1)
+        side = 2 * radius + 1
+        tables = []
+        for xx, xy, yx, yy in OCTANTS:
+            rows = []
+            for j in range(1, radius + 1):
+                row = []
+                dy = -j
+                for dx in range(-j, 1):
+                    mx, my = dx * xx + dy * xy, dx * yx + dy * yy
+                    row.append((mx, my, (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5),
+                                dx * dx + dy * dy <= limit, (my + radius) * side + mx + radius))
+                rows.append(row)
+            tables.append(rows)
+        _tables[radius] = tables
+    return tables
+
+
+def field_of_view(tiles, x, y, radius):
+    """Set of (x, y) tiles visible from (x, y) within radius, including (x, y) itself."""
+    patch = _patch(tiles, x, y, radius)
+    offsets = _views.get(patch)
+    if offsets is None:
+        # What is visible depends only on the patch, which repeats all over a maze, so the
+        # cast is done once per patch, in offsets from the viewer
+        visible = {(0, 0)}
+        for rows in octant_tables(radius):
+            _cast(patch, rows, 0, 1.0, 0.0, visible)
+        offsets = tuple(visible)
+        if len(_views) >= MAX_CACHED_VIEWS:
+            _views.clear()
+        _views[patch] = offsets
+    return {(x + dx, y + dy) for dx, dy in offsets}
+
+
+def _patch(tiles, cx, cy, radius):
+    # The square of tiles around the viewer as one flat bytes object (see _PATCH_CODES),
+    # read a row at a time, so scans index it instead of asking the map about every cell
+    side = 2 * radius + 1
+    x0, x1 = max(cx - radius, 0), min(cx + radius + 1, tiles.width)
+    y0, y1 = max(cy - radius, 0), min(cy + radius + 1, tiles.height)
+    if x0 >= x1 or y0 >= y1:
+        return bytes(side * side)
+    row_codes = tiles.row_codes
+    left, right = _OFF_MAP * (x0 - cx + radius), _OFF_MAP * (cx + radius + 1 - x1)
+    rows = [row_codes(y, x0, x1) for y in range(y0, y1)]
+    patch = (_OFF_MAP * (side * (y0 - cy + radius)) + left + (right + left).join(rows) + right
+             + _OFF_MAP * (side * (cy + radius + 1 - y1)))
+    return patch.translate(_PATCH_CODES)
+
+
+def _cast(patch, rows, first, start, end, visible):
+    # Scan rows first.. of one octant between slopes start and end (start >= end), lighting
+    # each cell in view and recursing past every wall into the still-open part of the arc.
+    # A child scan can be handed an empty arc (start < end); it must not light anything.
+    if start < end:
+        return
+    for j in range(first, len(rows)):
+        blocked = False
+        new_start = start
+        for ox, oy, left, right, inside, k in rows[j]:
+            if start < right:
+                continue
+            if end > left:
+                break
+            code = patch[k]
+            # Off the map counts as a wall that is never lit
+            opaque = code != 2
+            if code and inside:
+                visible.add((ox, oy))
+            if blocked:
+                if opaque:
+                    new_start = right
+                    continue
+                blocked = False
+                start = new_start
+            elif opaque and j + 1 < len(rows):
+                blocked = True
+                _cast(patch, rows, j + 1, start, left, visible)
+                new_start = right
+        if blocked:
+            break
@@ -1,58 +1,47 @@
 """
 game.py
 
-Main game loop and state management. Orchestrates player, adversary, renderer, and input.
+Interactive game loop. Renders the GameEngine state, reads keys and steps the engine.
 """
 
 import os
-import sys
 import time
 import json
-from mapgen import generate_map
-from entities import Player, Adversary
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from engine import RUNNING, GameEngine
+from profiler import FrameProfiler
 from renderer import Renderer
-from utils import get_terminal_size, get_version, is_open_tile, is_floor
+from replay import Recorder
+from snapshot import SnapshotError
+from terminal import KeyReader
+from utils import get_terminal_size, get_version
 
-if os.name == "nt":
-    import msvcrt
-else:
-    import termios
-    import tty
+# Most ticks the real-time loop will run back to back to catch up after a stall
+MAX_CATCH_UP = 5
+# Most move and wait keys kept queued while ticks catch up; later ones are dropped
+MAX_QUEUED_TURNS = 8
+TURN_KEYS = frozenset("wsadWSAD. ")
+# Action for the wait key: the player stands still and the world takes its turn
+WAIT = "wait"
 
-class Game:
-    def __init__(self, map_width, map_height):
-        self.map, (px, py), self.exit_pos = generate_map(map_width, map_height)
+class Game(GameEngine):
+    """Interactive terminal game: renders, reads keys and steps the engine once per key."""
+    def _start_session(self, autosave, autosave_interval):
+        super()._start_session(autosave, autosave_interval)
         self.version = get_version()
-        self.player = Player(px, py)
-        self.messages = []
         self.running = True
         self.last_frame_time = time.time()
         self.fps = 0.0
-        self.tick = 0
-
-        # FOG OF WAR: tracks which tiles have been seen
-        self.seen = [[False for _ in range(map_width)] for _ in range(map_height)]
-        self._reveal_visible_area()
-
-        # Adversary: spawn far from player
-        ax, ay = self._find_far_spawn(px, py)
-        self.adversary = Adversary(ax, ay)
-        self.player_slow_counter = 0
-
         self.viewport_width, self.viewport_height = self._get_dynamic_viewport_size()
         self.renderer = Renderer()
-
-    def _find_far_spawn(self, px, py):
-        best = (0, 0)
-        max_dist = -1
-        for y in range(len(self.map)):
-            for x in range(len(self.map[0])):
-                if self.map[y][x] == '.':
-                    d = abs(x - px) + abs(y - py)
-                    if d > max_dist:
-                        best = (x, y)
-                        max_dist = d
-        return best
+        # Typed but not yet used keys; a held-down key cannot queue up more than a few moves
+        self.pending_keys = deque()
+        self.keys = None
+        # Whole-map view in place of the viewport, toggled with M
+        self.minimap = False
+        # Per-phase timings; off unless toggled with P or started with profile=True
+        self.profiler = FrameProfiler(self)
 
     def _get_dynamic_viewport_size(self):
         term_w, term_h = get_terminal_size()
@@ -60,125 +49,226 @@ class Game:
         reserved_bottom = 3
         reserved_input = 1
         available_h = max(term_h - reserved_top - reserved_bottom - reserved_input, 1)
-        vp_w = min(term_w, len(self.map[0]))
-        vp_h = min(available_h, len(self.map))
+        vp_w = max(min(term_w, self.map.width), 1)
+        vp_h = min(available_h, self.map.height)
         return vp_w, vp_h
 
-    def run(self):
+    def run(self, tick_rate=0, frame_rate=30, profile=False, profile_export=None, speculate=True):
+        """
+        Play until the game ends or the player quits. With tick_rate=0 the world advances
+        one tick per key, as a turn-based game. Otherwise it advances tick_rate times a
+        second whether or not keys are pressed, each tick using the oldest queued move, and
+        frames are drawn only after a tick changed something, at most frame_rate a second.
+
+        profile starts with the frame profiler on; profile_export names a JSON file that
+        receives its timings when the game ends. speculate lets the turn-based loop plan
+        the adversaries' reply to every possible key on a worker thread while it waits.
+        """
+        if profile:
+            self.profiler.enable()
+        with KeyReader() as self.keys:
+            try:
+                if tick_rate:
+                    self._run_realtime(tick_rate, frame_rate)
+                elif speculate:
+                    with ThreadPoolExecutor(max_workers=1) as worker:
+                        self._run_turns(worker)
+                else:
+                    self._run_turns()
+            except EOFError:
+                self.running = False
+        self.keys = None
+        self.close()
+        if profile_export:
+            self.profiler.export(profile_export)
+
+    def _run_turns(self, worker=None):
+        # A frame runs from a key arriving to the next frame being drawn; the time spent
+        # waiting for the key is the player's, not the game's
+        frame_start = None
         while self.running:
-            frame_start = time.time()
-            self.renderer.render(self, self.player, self.adversary, self.exit_pos)
+            self.renderer.render(self, self.player, self.adversaries)
+            if frame_start is not None:
+                self._update_fps(time.time() - frame_start)
+                frame_start = None
+            # Plan the adversaries' reply to each key while the player decides; a key that is
+            # already queued would only have to wait for the planning
+            planning = None
+            if worker is not None and not self.pending_keys:
+                stop = []
+                planning = worker.submit(self.speculate, lambda: stop)
             command = self._getch()
-            moved = self._handle_input(command)
-            player_on_red_trail = (self.player.x, self.player.y) in self.adversary.trail
-            if player_on_red_trail:
-                if self.player_slow_counter == 0 and moved:
-                    self.player_slow_counter = 1
-                    self._add_message("You are slowed by the adversary's trail!")
-                elif self.player_slow_counter > 0:
-                    self.player_slow_counter -= 1
-                    moved = False
-                    self._add_message("You are slowed by the adversary's trail!")
-            else:
-                self.player_slow_counter = 0
-            if moved:
-                self.player.trail.add((self.player.x, self.player.y))
-                self.player.explored.add((self.player.x, self.player.y))
-            self._reveal_visible_area()
+            frame_start = time.time()
+            if planning is not None:
+                # The state must not change under the planner: cut it short and wait for it
+                stop.append(True)
+                planning.result()
+            action = self._handle_input(command)
+            if not self.running:
+                break
+            if action is None:
+                # Keys like the map or profiler toggles only change the view
+                continue
+            if self.step(None if action == WAIT else action) != RUNNING:
+                self.renderer.render(self, self.player, self.adversaries)
+                break
 
-            self.adversary.move(self, self.player.trail, (self.player.x, self.player.y), is_floor, self._add_message)
+    def _run_realtime(self, tick_rate, frame_rate):
+        tick_interval = 1.0 / tick_rate
+        frame_interval = 1.0 / frame_rate if frame_rate else 0.0
+        now = time.monotonic()
+        next_tick = now + tick_interval
+        next_frame = now
+        dirty = True
+        while self.running:
+            now = time.monotonic()
+            if dirty and now >= next_frame:
+                self.renderer.render(self, self.player, self.adversaries)
+                self._update_fps(now - self.last_frame_time)
+                self.last_frame_time = now
+                next_frame = now + frame_interval
+                dirty = False
 
-            if (self.adversary.x, self.adversary.y) == (self.player.x, self.player.y):
-                self._add_message("You lose! The adversary caught you!")
-                self.renderer.render(self, self.player, self.adversary, self.exit_pos)
-                break
+            # Sleep in the selector until the next tick (or pending frame), collecting keys meanwhile
+            wake = min(next_tick, next_frame) if dirty else next_tick
+            self._queue_keys(self._read_keys(max(0.0, wake - time.monotonic())))
 
-            if (self.player.x, self.player.y) == self.exit_pos:
-                self._add_message("You found the exit! Congratulations!")
-                self.renderer.render(self, self.player, self.adversary, self.exit_pos)
-                break
+            now = time.monotonic()
+            ticks = 0
+            while now >= next_tick and self.running:
+                action = self._next_action()
+                if not self.running:
+                    break
+                dirty = True
+                if self.step(None if action == WAIT else action) != RUNNING:
+                    self.renderer.render(self, self.player, self.adversaries)
+                    return
+                next_tick += tick_interval
+                ticks += 1
+                if ticks >= MAX_CATCH_UP:
+                    # Fell too far behind (e.g. the quit prompt); drop the backlog instead of fast-forwarding
+                    next_tick = now + tick_interval
+                    break
 
-            self.tick += 1
-            frame_end = time.time()
-            self._update_fps(frame_end - frame_start)
+    def _next_action(self):
+        # Other keys are handled as they come; the first move or wait key is this tick's action
+        while self.pending_keys:
+            action = self._handle_input(self.pending_keys.popleft())
+            if action is not None or not self.running:
+                return action
+        return None
 
     def _update_fps(self, frame_duration):
         self.fps = 1.0 / frame_duration if frame_duration > 0 else 0.0
 
-    def _reveal_visible_area(self):
-        px, py = self.player.x, self.player.y
-        for dy in range(-2, 3):
-            for dx in range(-2, 3):
-                x = px + dx
-                y = py + dy
-                if 0 <= y < len(self.map) and 0 <= x < len(self.map[0]):
-                    self.seen[y][x] = True
-
     def _getch(self):
-        if os.name == "nt":
-            ch = msvcrt.getch()
-            try:
-                return ch.decode("utf-8")
-            except Exception:
-                return ""
-        else:
-            fd = sys.stdin.fileno()
-            import termios
-            import tty
-            old_settings = termios.tcgetattr(fd)
-            try:
-                tty.setraw(fd)
-                ch = sys.stdin.read(1)
-            finally:
-                termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-            return ch
+        while not self.pending_keys:
+            self._queue_keys(self._read_keys(None))
+        return self.pending_keys.popleft()
+
+    def _queue_keys(self, keys):
+        # Past the cap the newest move and wait keys are dropped, so the turns already typed
+        # still happen in order; other keys (quit, toggles) are always kept
+        moves = sum(1 for key in self.pending_keys if key in TURN_KEYS)
+        for key in keys:
+            if key in TURN_KEYS:
+                if moves >= MAX_QUEUED_TURNS:
+                    continue
+                moves += 1
+            self.pending_keys.append(key)
+
+    def _read_keys(self, timeout):
+        # Waiting for the player and decoding what they typed are separate phases, so the
+        # profiler can keep the time spent deciding out of the frame timings
+        if not self._wait_for_keys(timeout):
+            return ""
+        return self._decode_keys()
+
+    def _wait_for_keys(self, timeout):
+        return self.keys.wait(timeout)
+
+    def _decode_keys(self):
+        return self.keys.drain()
 
     def _handle_input(self, command):
-        dx, dy = 0, 0
-        if command in ("w", "W"):
-            dy = -1
-        elif command in ("s", "S"):
-            dy = 1
-        elif command in ("a", "A"):
-            dx = -1
-        elif command in ("d", "D"):
-            dx = 1
+        """
+        Turn a key into an engine action, or WAIT to stand still for a tick; None for keys
+        that do not take a turn.
+        """
+        if command in ("w", "W", "s", "S", "a", "A", "d", "D"):
+            return command.lower()
+        elif command in (".", " "):
+            return WAIT
+        elif command in ("m", "M"):
+            self.minimap = not self.minimap
+        elif command in ("p", "P"):
+            self.profiler.toggle()
         elif command in ("q", "Q"):
             print("Are you sure you want to quit? (y/N)", end=' ', flush=True)
             confirm = self._getch()
             print(confirm)
+            # The prompt scrolled past the frame the renderer knows about
+            self.renderer.invalidate()
             if confirm in ("y", "Y"):
                 self.running = False
                 print("Goodbye!")
-                return False
             else:
                 self._add_message("Quit canceled.")
-                return False
-        else:
-            self._add_message("Invalid input! Use W/A/S/D to move, Q to quit.")
-            return False
-        moved = self.player.move(dx, dy, self.map, is_open_tile)
-        if moved:
-            self.tick += 1
         else:
-            self._add_message("You can't walk there.")
-        return moved
-
-    def _add_message(self, msg):
-        self.messages.append(msg)
+            self._add_message("Invalid input! Use W/A/S/D to move, . to wait, M for the map, P for the profiler, Q to quit.")
+        return None
 
 def main():
     config = {
         "map_width": 300,
-        "map_height": 300
+        "map_height": 300,
+        "world": "fixed",
+        "seed": None,
+        "chunk_size": 64,
+        "chunk_cache": 64,
+        "map_cache": True,
+        "max_resident": None,
+        "adversary_count": 1,
+        "trail_decay": None,
+        "sight_radius": 2,
+        "autosave": None,
+        "autosave_interval": 1000,
+        "tick_rate": 0,
+        "frame_rate": 30,
+        "profile": False,
+        "profile_export": None,
+        "speculate": True,
+        "record": None,
+        "keyframe_interval": 1000
     }
     try:
         with open("../config.json") as f:
             config.update(json.load(f))
     except Exception:
         pass
-    game = Game(config["map_width"], config["map_height"])
-    game.run()
+    game = None
+    if config["autosave"] and os.path.exists(config["autosave"]):
+        try:
+            game = Game.load(config["autosave"], config["autosave_interval"])
+        except (OSError, SnapshotError):
+            game = None
+    if game is None:
+        game = Game(
+            config["map_width"], config["map_height"],
+            world=config["world"], seed=config["seed"],
+            chunk_size=config["chunk_size"], chunk_cache=config["chunk_cache"],
+            map_cache=config["map_cache"], max_resident=config["max_resident"],
+            adversary_count=config["adversary_count"], trail_decay=config["trail_decay"],
+            autosave=config["autosave"], autosave_interval=config["autosave_interval"],
+            sight_radius=config["sight_radius"],
+        )
+    if config["record"]:
+        # Replay later with: python replay.py <record file>
+        recorder = Recorder(config["record"], game, config["keyframe_interval"])
+        if recorder.path != config["record"]:
+            game._add_message(f"{config['record']} already exists; recording to {recorder.path}")
+    game.run(config["tick_rate"], config["frame_rate"], config["profile"], config["profile_export"],
+             config["speculate"])
 
 if __name__ == "__main__":
     main()
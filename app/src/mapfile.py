@@ -0,0 +1,207 @@
+"""
+mapfile.py
+
+Versioned binary map files. A fixed header (dimensions, seed, generator parameters,
+player start and exit) is followed by the raw padded TileMap cells, so a map loads
+through mmap without copying or parsing tiles. Also provides an on-disk cache keyed by
+generator parameters and a paged reader for files too large to keep resident.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from mapgen import generate_map
+from tilemap import TILE_CHARS, WALL, FLOOR, TileMap
+
+MAGIC = b"LCMAP\x00\x00\x00"
+FORMAT_VERSION = 1
+# Bump when generate_map output changes for the same parameters, to invalidate cached maps
+GENERATOR_VERSION = 2
+
+FLAG_HAS_SEED = 1
+
+_HEADER = struct.Struct("<8sHHIIqIIII16sIIII")
+
+GENERATOR_DEFAULTS = {
+    "room_min": 4,
+    "room_max": 12,
+    "max_rooms": 15,
+    "maze_algorithm": "backtracker",
+    "maze_min_size": 10,
+}
+
+
+class MapFormatError(ValueError):
+    pass
+
+
+def save_map(path, grid, player_start, exit_pos, seed=None, **params):
+    if seed is not None and not _storable_seed(seed):
+        raise ValueError(f"Seed does not fit a map file header: {seed!r}")
+    params = {**GENERATOR_DEFAULTS, **params}
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, FLAG_HAS_SEED if seed is not None else 0,
+        grid.width, grid.height, seed or 0,
+        params["room_min"], params["room_max"], params["max_rooms"], params["maze_min_size"],
+        params["maze_algorithm"].encode("ascii"),
+        player_start[0], player_start[1], exit_pos[0], exit_pos[1],
+    )
+    # Write to a temporary name first so readers never see a half-written file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(grid.cells)
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        return _parse_header(f.read(_HEADER.size), os.fstat(f.fileno()).st_size)
+
+
+def load_map(path, max_resident=None):
+    """
+    Load a map file; returns (grid, player_start, exit_pos) like generate_map.
+
+    The grid is a TileMap whose cells are a copy-on-write mmap view of the file.
+    If the tile data is larger than max_resident bytes, a PagedTileMap is returned
+    instead, which keeps at most that many bytes of tiles in memory.
+    """
+    header = read_header(path)
+    if max_resident is not None and header["tile_bytes"] > max_resident:
+        grid = PagedTileMap(path, header, max_resident)
+    else:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        cells = memoryview(mm)[_HEADER.size:_HEADER.size + header["tile_bytes"]]
+        grid = TileMap.from_buffer(header["width"], header["height"], cells)
+    return grid, header["player_start"], header["exit_pos"]
+
+
+def cache_dir():
+    return os.environ.get("LAYERCAKE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "layercake", "maps")
+
+
+def cache_key(width, height, seed, **params):
+    params = {**GENERATOR_DEFAULTS, **params}
+    fields = [FORMAT_VERSION, GENERATOR_VERSION, width, height, seed] + [params[k] for k in sorted(params)]
+    return hashlib.sha1(repr(fields).encode()).hexdigest()
+
+
+def load_or_generate(width, height, seed, max_resident=None, **params):
+    """
+    Return a cached map for these generator parameters, generating and saving it on a miss.
+    Seeds the header cannot store (not a 64-bit integer) skip the cache.
+    """
+    if not _storable_seed(seed):
+        return generate_map(width, height, seed=seed, **params)
+    path = os.path.join(cache_dir(), cache_key(width, height, seed, **params) + ".lcmap")
+    if os.path.exists(path):
+        try:
+            return load_map(path, max_resident)
+        except MapFormatError:
+            pass
+    grid, player_start, exit_pos = generate_map(width, height, seed=seed, **params)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_map(path, grid, player_start, exit_pos, seed=seed, **params)
+    except OSError:
+        # A read-only or full cache directory should never stop the game from starting
+        pass
+    return grid, player_start, exit_pos
+
+
+def _storable_seed(seed):
+    # The header keeps the seed as a signed 64-bit integer
+    return isinstance(seed, int) and not isinstance(seed, bool) and -2 ** 63 <= seed < 2 ** 63
+
+
+def _parse_header(data, file_size):
+    if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+        raise MapFormatError("Not a layercake map file")
+    (magic, version, flags, width, height, seed, room_min, room_max, max_rooms, maze_min_size,
+     maze_algorithm, sx, sy, ex, ey) = _HEADER.unpack(data[:_HEADER.size])
+    if version != FORMAT_VERSION:
+        raise MapFormatError(f"Unsupported map file version: {version}")
+    tile_bytes = (width + 2) * (height + 2)
+    if file_size < _HEADER.size + tile_bytes:
+        raise MapFormatError("Map file is truncated")
+    return {
+        "width": width,
+        "height": height,
+        "seed": seed if flags & FLAG_HAS_SEED else None,
+        "room_min": room_min,
+        "room_max": room_max,
+        "max_rooms": max_rooms,
+        "maze_algorithm": maze_algorithm.rstrip(b"\x00").decode("ascii"),
+        "maze_min_size": maze_min_size,
+        "player_start": (sx, sy),
+        "exit_pos": (ex, ey),
+        "tile_bytes": tile_bytes,
+    }
+
+
+class PagedTileMap:
+    """
+    Read-only map backed by a map file, loaded in bands of rows kept in an LRU cache.
+
+    Exposes the TileMap read interface (width, height, in_bounds, get, is_floor,
+    is_open, row_codes, row_bytes, row).
+    """
+    def __init__(self, path, header, max_resident, band_rows=64):
+        self.path = path
+        self.width = header["width"]
+        self.height = header["height"]
+        self.stride = self.width + 2
+        self.band_rows = band_rows
+        self.max_bands = max(1, max_resident // (self.stride * band_rows))
+        self.bands = OrderedDict()
+        self._file = open(path, "rb")
+
+    def close(self):
+        self._file.close()
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return WALL
+        band_index, row = divmod(y, self.band_rows)
+        return self._band(band_index)[row * self.stride + x + 1]
+
+    def is_floor(self, x, y):
+        return self.get(x, y) == FLOOR
+
+    def is_open(self, x, y):
+        return self.get(x, y) != WALL
+
+    def row_codes(self, y, x0=0, x1=None):
+        if x1 is None:
+            x1 = self.width
+        band_index, row = divmod(y, self.band_rows)
+        start = row * self.stride + 1
+        return self._band(band_index)[start + x0:start + x1]
+
+    def row_bytes(self, y, x0=0, x1=None):
+        return self.row_codes(y, x0, x1).translate(TILE_CHARS)
+
+    def row(self, y, x0=0, x1=None):
+        return self.row_bytes(y, x0, x1).decode("ascii")
+
+    def _band(self, band_index):
+        band = self.bands.get(band_index)
+        if band is not None:
+            self.bands.move_to_end(band_index)
+            return band
+        first_row = band_index * self.band_rows
+        rows = min(self.band_rows, self.height - first_row)
+        # Skip the header and the top border row
+        self._file.seek(_HEADER.size + (first_row + 1) * self.stride)
+        band = self._file.read(rows * self.stride)
+        self.bands[band_index] = band
+        if len(self.bands) > self.max_bands:
+            self.bands.popitem(last=False)
+        return band
@@ -7,59 +7,97 @@ Generates rooms, corridors, and a maze near the exit with guaranteed connectivit
 """
 
 import random
-from collections import deque
-
-def generate_map(width, height, room_min=4, room_max=12, max_rooms=15, seed=None):
-    if seed is not None:
-        random.seed(seed)
-
-    grid = [['#' for _ in range(width)] for _ in range(height)]
+from array import array
+from distfield import UNREACHABLE, DistanceField
+from spatial import RoomIndex
+from tilemap import TileMap, WALL, FLOOR, EXIT
+
+def generate_map(width, height, room_min=4, room_max=12, max_rooms=15, seed=None,
+                 maze_algorithm="backtracker", maze_min_size=10):
+    # A private generator per call keeps concurrent generations independent of each other
+    # and of the global random module; seed=None draws fresh entropy from the OS
+    rng = random.Random(seed)
+
+    grid = TileMap(width, height)
     rooms = []
+    room_index = RoomIndex(room_max + 2)
+    links = []
     for _ in range(max_rooms):
         # Vary room size more for variety
-        w = random.randint(room_min, room_max)
-        h = random.randint(room_min, room_max)
-        x = random.randint(1, width - w - 2)
-        y = random.randint(1, height - h - 2)
+        w = rng.randint(room_min, room_max)
+        h = rng.randint(room_min, room_max)
+        x = rng.randint(1, width - w - 2)
+        y = rng.randint(1, height - h - 2)
         new_room = (x, y, w, h)
 
-        if any(_rooms_overlap(new_room, other) for other in rooms):
+        if room_index.overlaps(new_room):
             continue
-        _carve_room(grid, new_room)
         if rooms:
-            prev_center = _room_center(rooms[-1])
-            curr_center = _room_center(new_room)
-            _carve_corridor(grid, prev_center, curr_center)
+            # Link to the nearest earlier room; these links alone already span every room
+            links.append((len(rooms), room_index.nearest_index(room_center(new_room))))
         rooms.append(new_room)
+        room_index.add(new_room)
 
-    player_start = _room_center(rooms[0]) if rooms else (1, 1)
+    player_start = room_center(rooms[0]) if rooms else (1, 1)
     exit_room = _find_exit_room(rooms, player_start)
-    exit_pos = _room_center(exit_room)
 
-    # Maze area near exit room
-    maze_area = _define_maze_area(exit_room, width, height)
-    _carve_maze(grid, maze_area)
+    # Maze area near exit room. It is carved first: everything after this only turns walls
+    # into floor, which can never disconnect anything, so connectivity holds by construction.
+    maze_area = _define_maze_area(exit_room, width, height, maze_min_size)
+    _carve_maze(grid, maze_area, maze_algorithm, rng)
 
-    # Connect maze to rooms with multiple corridors (more connections for accessibility)
-    _connect_maze_to_rooms(grid, maze_area, rooms, connections=4)
+    for room in rooms:
+        _carve_room(grid, room)
+    for i, j in _room_spanning_tree(rooms, room_index, links):
+        carve_corridor(grid, room_center(rooms[i]), room_center(rooms[j]), rng)
 
-    # Place exit door inside maze center
-    maze_center = ((maze_area[0] + maze_area[2]) // 2, (maze_area[1] + maze_area[3]) // 2)
-    exit_pos = maze_center
-    _mark_cell(grid, exit_pos, '>')
+    # Connect maze to rooms with multiple corridors (more connections for accessibility)
+    _connect_maze_to_rooms(grid, maze_area, room_index, rng, connections=4)
 
     # Add extra loops and cross connections between rooms
-    _add_extra_loops(grid, rooms)
+    _add_extra_loops(grid, rooms, rng)
 
-    # Ensure connectivity from player to exit, fix if necessary
-    if not _is_reachable(grid, player_start, exit_pos):
-        _fix_connectivity(grid, player_start, exit_pos)
+    # Place exit door on the maze cell the longest walk from the start; rooms were picked by
+    # straight-line distance before anything was carved, but the maze is what makes the walk long
+    exit_pos = _farthest_maze_cell(grid, maze_area, player_start) or room_center(exit_room)
+    _mark_cell(grid, exit_pos, EXIT)
 
     return grid, player_start, exit_pos
 
-def _define_maze_area(exit_room, map_width, map_height):
+def _room_spanning_tree(rooms, room_index, links):
+    # Kruskal over short candidate edges (rooms in neighboring index cells) plus the
+    # nearest-earlier-room links, which guarantee the candidate graph is connected
+    edges = set(links)
+    for i, room in enumerate(rooms):
+        for j, _, _ in room_index.centers_near(room_center(room)):
+            if i != j:
+                edges.add((i, j))
+    weighted = sorted(
+        (_dist(room_center(rooms[i]), room_center(rooms[j])), min(i, j), max(i, j))
+        for i, j in edges
+    )
+    parent = list(range(len(rooms)))
+    tree = []
+    for _, i, j in weighted:
+        ri, rj = _find(parent, i), _find(parent, j)
+        if ri != rj:
+            parent[rj] = ri
+            tree.append((i, j))
+            if len(tree) == len(rooms) - 1:
+                break
+    return tree
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+def _define_maze_area(exit_room, map_width, map_height, min_size=10):
     x, y, w, h = exit_room
-    maze_w, maze_h = max(10, w), max(10, h)
+    maze_w, maze_h = max(min_size, w), max(min_size, h)
 
     if y + h + maze_h + 2 < map_height:
         x1 = x
@@ -78,121 +116,217 @@ def _define_maze_area(exit_room, map_width, map_height):
         y2 = min(y1 + maze_h - 1, map_height - 3)
     return (x1, y1, x2, y2)
 
-def _carve_maze(grid, area):
+def _maze_cells(area):
+    # Maze cells sit on odd offsets inside the area; returns the first cell and the cell counts
     x1, y1, x2, y2 = area
     width = x2 - x1 + 1
     height = y2 - y1 + 1
-
-    for y in range(y1, y2 + 1):
-        for x in range(x1, x2 + 1):
-            grid[y][x] = '#'
-
     maze_w = width if width % 2 == 1 else width - 1
     maze_h = height if height % 2 == 1 else height - 1
+    return x1 + 1, y1 + 1, maze_w // 2, maze_h // 2
+
+def _maze_center(area):
+    start_x, start_y, cols, rows = _maze_cells(area)
+    if cols <= 0 or rows <= 0:
+        return None
+    return start_x + 2 * (cols // 2), start_y + 2 * (rows // 2)
+
+def _farthest_maze_cell(grid, area, start):
+    # Scans the distance array a maze row at a time (every other cell) instead of listing
+    # every maze cell; ties go to the first cell in row order, as in DistanceField.farthest
+    start_x, start_y, cols, rows = _maze_cells(area)
+    dist = DistanceField(grid, start).dist
+    best, best_dist = None, UNREACHABLE
+    for j in range(rows):
+        y = start_y + 2 * j
+        i = grid.index(start_x, y)
+        row = dist[i:i + 2 * cols - 1:2]
+        d = max(row, default=UNREACHABLE)
+        if d > best_dist:
+            best, best_dist = (start_x + 2 * row.index(d), y), d
+    return best or _maze_center(area)
+
+def _carve_maze(grid, area, algorithm, rng):
+    x1, y1, x2, y2 = area
+    grid.fill_rect(x1, y1, x2 - x1 + 1, y2 - y1 + 1, WALL)
+
+    start_x, start_y, cols, rows = _maze_cells(area)
+    if cols <= 0 or rows <= 0:
+        return
+
+    try:
+        carver = MAZE_ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown maze algorithm: {algorithm}") from None
+    # Walls between maze cells are carved as passages
+    carver(grid, grid.index(start_x, start_y), cols, rows, rng)
+
+def _maze_backtracker(grid, origin, cols, rows, rng):
+    # Depth-first backtracker on an explicit stack; carved cells double as the visited set
+    cells = grid.cells
+    step_x, step_y = 2, 2 * grid.stride
+    cells[origin] = FLOOR
+    stack = array('l', [0])
+    while stack:
+        cy, cx = divmod(stack[-1], cols)
+        here = origin + cx * step_x + cy * step_y
+        options = []
+        if cy > 0 and cells[here - step_y] == WALL:
+            options.append((-step_y, -cols))
+        if cx < cols - 1 and cells[here + step_x] == WALL:
+            options.append((step_x, 1))
+        if cy < rows - 1 and cells[here + step_y] == WALL:
+            options.append((step_y, cols))
+        if cx > 0 and cells[here - step_x] == WALL:
+            options.append((-step_x, -1))
+        if not options:
+            stack.pop()
+            continue
+        offset, cell_step = rng.choice(options)
+        cells[here + offset // 2] = FLOOR
+        cells[here + offset] = FLOOR
+        stack.append(stack[-1] + cell_step)
+
+def _maze_sidewinder(grid, origin, cols, rows, rng):
+    # Row-streaming: only the start of the current run is kept between cells
+    cells = grid.cells
+    step_y = 2 * grid.stride
+    first_row = origin
+    cells[first_row:first_row + 2 * cols - 1] = bytes((FLOOR,)) * (2 * cols - 1)
+    for cy in range(1, rows):
+        row = origin + cy * step_y
+        run_start = 0
+        for cx in range(cols):
+            here = row + 2 * cx
+            cells[here] = FLOOR
+            if cx == cols - 1 or rng.random() < 0.5:
+                up = row + 2 * rng.randint(run_start, cx)
+                cells[up - step_y // 2] = FLOOR
+                run_start = cx + 1
+            else:
+                cells[here + 1] = FLOOR
+
+def _maze_eller(grid, origin, cols, rows, rng):
+    # Eller's algorithm: one row of set labels is all the state carried between rows
+    cells = grid.cells
+    step_y = 2 * grid.stride
+    sets = [0] * cols
+    next_set = 1
+    for cy in range(rows):
+        row = origin + cy * step_y
+        last_row = cy == rows - 1
+        for cx in range(cols):
+            if not sets[cx]:
+                sets[cx] = next_set
+                next_set += 1
+            cells[row + 2 * cx] = FLOOR
+
+        # Join horizontal neighbors; a small union-find keeps merges linear in the row width
+        parent = {}
+
+        def find(s):
+            root = s
+            while root in parent:
+                root = parent[root]
+            while s != root:
+                parent[s], s = root, parent[s]
+            return root
+
+        for cx in range(cols - 1):
+            a, b = find(sets[cx]), find(sets[cx + 1])
+            if a != b and (last_row or rng.random() < 0.5):
+                parent[b] = a
+                cells[row + 2 * cx + 1] = FLOOR
+        sets = [find(s) for s in sets]
+        if last_row:
+            break
 
-    start_x = x1 + 1
-    start_y = y1 + 1
-
-    visited = [[False for _ in range(maze_w // 2)] for _ in range(maze_h // 2)]
-
-    def carve(cx, cy):
-        visited[cy][cx] = True
-        directions = [(0, -1), (1, 0), (0, 1), (-1, 0)]
-        random.shuffle(directions)
-        for dx, dy in directions:
-            nx, ny = cx + dx, cy + dy
-            if 0 <= nx < maze_w // 2 and 0 <= ny < maze_h // 2 and not visited[ny][nx]:
-                wx = start_x + cx * 2 + dx
-                wy = start_y + cy * 2 + dy
-                grid[wy][wx] = '.'
-                grid[start_y + ny * 2][start_x + nx * 2] = '.'
-                carve(nx, ny)
-
-    grid[start_y][start_x] = '.'
-    carve(0, 0)
-
-def _connect_maze_to_rooms(grid, maze_area, rooms, connections=4):
-    x1, y1, x2, y2 = maze_area
-    maze_edges = []
-
-    for x in range(x1, x2 + 1):
-        maze_edges.append((x, y1))
-        maze_edges.append((x, y2))
-    for y in range(y1 + 1, y2):
-        maze_edges.append((x1, y))
-        maze_edges.append((x2, y))
+        # Drop at least one passage from every set into the next row
+        members = {}
+        for cx, s in enumerate(sets):
+            members.setdefault(s, []).append(cx)
+        below = [0] * cols
+        for s, group in members.items():
+            forced = rng.choice(group)
+            for cx in group:
+                if cx == forced or rng.random() < 0.35:
+                    cells[row + 2 * cx + step_y // 2] = FLOOR
+                    below[cx] = s
+        sets = below
+
+MAZE_ALGORITHMS = {
+    "backtracker": _maze_backtracker,
+    "sidewinder": _maze_sidewinder,
+    "eller": _maze_eller,
+}
+
+def _connect_maze_to_rooms(grid, maze_area, room_index, rng, connections=4):
+    # Corridors start on the outermost maze cells, which are always part of the maze
+    start_x, start_y, cols, rows = _maze_cells(maze_area)
+    if cols <= 0 or rows <= 0:
+        return
+    last_x, last_y = start_x + 2 * (cols - 1), start_y + 2 * (rows - 1)
+    maze_edges = set()
+    for x in range(start_x, last_x + 1, 2):
+        maze_edges.add((x, start_y))
+        maze_edges.add((x, last_y))
+    for y in range(start_y, last_y + 1, 2):
+        maze_edges.add((start_x, y))
+        maze_edges.add((last_x, y))
+    maze_edges = sorted(maze_edges)
 
     # Shuffle edges to connect randomly
-    random.shuffle(maze_edges)
+    rng.shuffle(maze_edges)
 
     connected_rooms = set()
     conn_made = 0
     for edge_pos in maze_edges:
         # Find nearest room center
-        nearest_room = min(rooms, key=lambda r: _dist(edge_pos, _room_center(r)))
-        room_center = _room_center(nearest_room)
+        nearest_room = room_index.nearest(edge_pos)
+        center = room_center(nearest_room)
         # Connect if not already connected enough
         if (nearest_room not in connected_rooms or conn_made < connections):
-            _carve_corridor(grid, edge_pos, room_center)
+            carve_corridor(grid, edge_pos, center, rng)
             connected_rooms.add(nearest_room)
             conn_made += 1
         if conn_made >= connections:
             break
 
-def _add_extra_loops(grid, rooms):
+def _add_extra_loops(grid, rooms, rng):
     # Randomly add cross corridors between random pairs of rooms for loops
-    room_pairs = []
     n = len(rooms)
-    for i in range(n):
-        for j in range(i + 1, n):
-            room_pairs.append((rooms[i], rooms[j]))
-    random.shuffle(room_pairs)
-
-    for (r1, r2) in room_pairs[:max(3, n//3)]:
-        c1 = _room_center(r1)
-        c2 = _room_center(r2)
-        _carve_corridor(grid, c1, c2)
-
-
-
-def _is_reachable(grid, start, goal, max_steps=100000):
-    queue = deque([start])
-    visited = set()
-    steps = 0
-    while queue:
-        if steps > max_steps:
-            # Fail fast if BFS takes too long
-            return False
-        x, y = queue.popleft()
-        if (x, y) == goal:
-            return True
-        visited.add((x, y))
-        steps += 1
-        for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= ny < len(grid) and 0 <= nx < len(grid[0]):
-                if grid[ny][nx] in ('.', '>') and (nx, ny) not in visited:
-                    queue.append((nx, ny))
-    return False
-
-def _fix_connectivity(grid, start, goal):
-    # Try carving corridors from start and goal towards center to improve connectivity
-    cx = (start[0] + goal[0]) // 2
-    cy = (start[1] + goal[1]) // 2
-    _carve_corridor(grid, start, (cx, cy))
-    _carve_corridor(grid, (cx, cy), goal)
+    for i, j in _sample_room_pairs(n, max(3, n // 3), rng):
+        c1 = room_center(rooms[i])
+        c2 = room_center(rooms[j])
+        carve_corridor(grid, c1, c2, rng)
+
+def _sample_room_pairs(n, count, rng):
+    # Draw distinct index pairs lazily instead of materializing all n*(n-1)/2 of them
+    total = n * (n - 1) // 2
+    if total <= count:
+        pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+        rng.shuffle(pairs)
+        return pairs
+    chosen = set()
+    pairs = []
+    while len(pairs) < count:
+        i, j = sorted(rng.sample(range(n), 2))
+        if (i, j) not in chosen:
+            chosen.add((i, j))
+            pairs.append((i, j))
+    return pairs
+
 
 
 def _carve_room(grid, room):
     x, y, w, h = room
-    for i in range(y, y + h):
-        for j in range(x, x + w):
-            grid[i][j] = '.'
+    grid.fill_rect(x, y, w, h, FLOOR)
 
-def _carve_corridor(grid, start, end):
+def carve_corridor(grid, start, end, rng):
+    """L-shaped floor corridor from start to end, bending at a random corner; also used by world.py."""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5:
+    if rng.random() < 0.5:
         _carve_horiz(grid, x1, x2, y1)
         _carve_vert(grid, y1, y2, x2)
     else:
@@ -200,24 +334,13 @@ def _carve_corridor(grid, start, end):
         _carve_horiz(grid, x1, x2, y2)
 
 def _carve_horiz(grid, x1, x2, y):
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        grid[y][x] = '.'
+    grid.hline(x1, x2, y, FLOOR)
 
 def _carve_vert(grid, y1, y2, x):
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        grid[y][x] = '.'
-
-def _rooms_overlap(r1, r2, padding=1):
-    x1, y1, w1, h1 = r1
-    x2, y2, w2, h2 = r2
-    return (
-        x1 - padding < x2 + w2 and
-        x1 + w1 + padding > x2 and
-        y1 - padding < y2 + h2 and
-        y1 + h1 + padding > y2
-    )
+    grid.vline(y1, y2, x, FLOOR)
 
-def _room_center(room):
+def room_center(room):
+    """Center tile of an (x, y, w, h) room."""
     x, y, w, h = room
     cx = x + w // 2
     cy = y + h // 2
@@ -225,19 +348,19 @@ def _room_center(room):
 
 def _find_exit_room(rooms, start):
     sx, sy = start
-    farthest = max(rooms, key=lambda r: _dist((sx, sy), _room_center(r)))
+    farthest = max(rooms, key=lambda r: _dist((sx, sy), room_center(r)))
     return farthest
 
 def _dist(a, b):
     return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
-def _mark_cell(grid, pos, symbol):
+def _mark_cell(grid, pos, tile):
     x, y = pos
-    grid[y][x] = symbol
+    grid.set(x, y, tile)
 
 def print_map(grid):
-    for row in grid:
-        print("".join(row))
+    for row in grid.rows():
+        print(row)
 
 if __name__ == "__main__":
     grid, start, exit_pos = generate_map(60, 30, seed=42)
@@ -0,0 +1,267 @@
+"""
+minimap.py
+
+Whole-map overviews. The tile array, fog and trails are downsampled into factor x factor
+blocks, with one class code per block (fog, wall, floor, trails, exit, entities). The
+reductions work on whole rows at once: each 0/1 row mask becomes a big integer with one
+byte per tile, the layers are packed into separate bits of those bytes, rows are OR-ed
+together vertically and shifted copies horizontally, and a bytes.translate table turns
+each block's bits into its class. Only the points (exit, entities) are placed one by one.
+
+The result renders as terminal half-block cells (two blocks per character) for the
+in-game map view, or as a PPM or PNG image.
+
+Usage:
+    python minimap.py --seeds 0:1000 --out overviews --factor 2 --format png
+"""
+
+import argparse
+import math
+import os
+import struct
+import zlib
+from batch import _parse_seeds
+from mapgen import generate_map
+from tilemap import OPEN_MASK
+
+FOG = 0
+WALL = 1
+FLOOR = 2
+ADVERSARY_TRAIL = 3
+PLAYER_TRAIL = 4
+EXIT = 5
+ADVERSARY = 6
+PLAYER = 7
+
+# Image colors and the nearest xterm-256 colors used in the terminal
+PALETTE = {
+    FOG: (0, 0, 0),
+    WALL: (58, 58, 70),
+    FLOOR: (176, 176, 164),
+    ADVERSARY_TRAIL: (150, 40, 40),
+    PLAYER_TRAIL: (40, 150, 60),
+    EXIT: (255, 204, 0),
+    ADVERSARY: (255, 40, 40),
+    PLAYER: (80, 255, 110),
+}
+TERMINAL_COLORS = {FOG: 16, WALL: 237, FLOOR: 249, ADVERSARY_TRAIL: 88, PLAYER_TRAIL: 28,
+                   EXIT: 220, ADVERSARY: 196, PLAYER: 83}
+
+# Layer bits packed into each tile's byte before reducing
+_OPEN, _SEEN, _PLAYER_TRAIL, _ADVERSARY_TRAIL = 1, 2, 4, 8
+
+
+def _class_table(fog):
+    table = bytearray(256)
+    for bits in range(16):
+        if fog and not bits & _SEEN:
+            cls = FOG
+        elif bits & _PLAYER_TRAIL:
+            cls = PLAYER_TRAIL
+        elif bits & _ADVERSARY_TRAIL:
+            cls = ADVERSARY_TRAIL
+        elif bits & _OPEN:
+            cls = FLOOR
+        else:
+            cls = WALL
+        table[bits] = cls
+    return bytes(table)
+
+
+_CLASSES = _class_table(fog=False)
+_CLASSES_FOG = _class_table(fog=True)
+_PLANES = [bytes(PALETTE.get(code, (0, 0, 0))[channel] for code in range(256)) for channel in range(3)]
+
+
+def overview(tiles, factor=2, seen=None, player_trail=None, adversary_trail=None,
+             exit_pos=None, player=None, adversaries=()):
+    """
+    Downsample a map into rows of block classes (bytearrays, ceil(width / factor) long).
+    With seen (a fog bitmap) blocks without a seen tile are FOG, only tiles around the
+    explored area are read, so unexplored parts of a chunked world are never generated,
+    and walls, floor and trails count where seen. Without it the whole map shows.
+    """
+    width, height = tiles.width, tiles.height
+    cols = -(-width // factor)
+    table = _CLASSES_FOG if seen is not None else _CLASSES
+    # With fog, only the rows and columns around the explored area are read at all
+    left, top, right, bottom = 0, 0, width, height
+    if seen is not None:
+        box = seen.bounds()
+        if box is None:
+            top = bottom = 0
+        else:
+            left, top, right, bottom = box
+            left = left // factor * factor
+        # Tiles are read in pieces of this many columns, only where a piece has a seen tile
+        page = getattr(seen, "page_size", width)
+    rows = []
+    for y0 in range(0, height, factor):
+        ys = range(max(y0, top), min(y0 + factor, height, bottom))
+        if not ys:
+            rows.append(bytearray(cols))
+            continue
+        x0, x1 = left, right
+        if seen is not None:
+            masks = [seen.row_mask(y, left, right) for y in ys]
+            any_seen = 0
+            for mask in masks:
+                any_seen |= int.from_bytes(mask, "little")
+            if not any_seen:
+                rows.append(bytearray(cols))
+                continue
+            # Only the blocks between the first and last seen tile need the tiles read
+            span = any_seen.to_bytes(right - left, "little")
+            x0 = (left + span.find(1)) // factor * factor
+            x1 = min(width, ((left + span.rfind(1)) // factor + 1) * factor)
+        n = x1 - x0
+        everything = int.from_bytes(b"\x01" * n, "little")
+        bits = 0
+        for k, y in enumerate(ys):
+            if seen is None:
+                seen_bits = everything
+                bits |= int.from_bytes(tiles.row_codes(y, x0, x1).translate(OPEN_MASK), "little")
+            else:
+                seen_bits = int.from_bytes(masks[k][x0 - left:x1 - left], "little")
+                bits |= _seen_open(tiles, y, x0, x1, span, left, page) & seen_bits
+            bits |= seen_bits << 1
+            if player_trail is not None:
+                bits |= (int.from_bytes(player_trail.row_mask(y, x0, x1), "little") & seen_bits) << 2
+            if adversary_trail is not None:
+                bits |= (int.from_bytes(adversary_trail.row_mask(y, x0, x1), "little") & seen_bits) << 3
+        # Fold each block's columns onto its first column, then keep every factor-th byte.
+        # Doubling shifts OR together windows of 2, 4, ... columns; a last shift by the
+        # remainder overlaps the largest window with itself to cover exactly factor columns.
+        folded = bits
+        width_done = 1
+        while width_done * 2 <= factor:
+            folded |= folded >> (8 * width_done)
+            width_done *= 2
+        if width_done < factor:
+            folded |= folded >> (8 * (factor - width_done))
+        row = bytearray(cols)
+        blocks = folded.to_bytes(n, "little")[::factor].translate(table)
+        row[x0 // factor:x0 // factor + len(blocks)] = blocks
+        rows.append(row)
+
+    def place(pos, cls):
+        x, y = pos
+        if seen is None or seen.get(x, y) or cls == PLAYER:
+            rows[y // factor][x // factor] = cls
+
+    if exit_pos is not None:
+        place(exit_pos, EXIT)
+    for pos in adversaries:
+        place(pos, ADVERSARY)
+    if player is not None:
+        place(player, PLAYER)
+    return rows
+
+
+def _seen_open(tiles, y, x0, x1, span, left, page):
+    # Open bits of row y, x0..x1-1, read only in the pages of columns where span (the seen
+    # mask of the block row, starting at left) has a tile, so no unseen chunk is generated
+    bits = 0
+    x = x0
+    while x < x1:
+        end = min(x1, (x // page + 1) * page)
+        if span.find(1, x - left, end - left) != -1:
+            bits |= int.from_bytes(tiles.row_codes(y, x, end).translate(OPEN_MASK), "little") << (8 * (x - x0))
+        x = end
+    return bits
+
+
+def game_overview(game, factor):
+    """overview() of a game as the player knows it: fogged, with trails and entities."""
+    return overview(game.map, factor, game.seen, game.player.trail, game.adversaries.trail,
+                    game.exit_pos, (game.player.x, game.player.y), game.adversaries.positions)
+
+
+def fit_factor(width, height, cols, rows):
+    """Smallest factor at which a width x height map fits cols x rows half-block characters."""
+    return max(1, math.ceil(width / max(cols, 1)), math.ceil(height / (2 * max(rows, 1))))
+
+
+_HALF_BLOCKS = {}
+
+
+def halfblock_rows(classes):
+    """Renderer cells for class rows, two rows per line: '▀' in the top color on the bottom color."""
+    lines = []
+    for i in range(0, len(classes), 2):
+        top = classes[i]
+        bottom = classes[i + 1] if i + 1 < len(classes) else bytes(len(top))
+        lines.append([_half_block(t, b) for t, b in zip(top, bottom)])
+    return lines
+
+
+def _half_block(top, bottom):
+    cell = _HALF_BLOCKS.get((top, bottom))
+    if cell is None:
+        if top == FOG and bottom == FOG:
+            cell = (' ', '')
+        else:
+            cell = ('▀', f"\033[38;5;{TERMINAL_COLORS[top]};48;5;{TERMINAL_COLORS[bottom]}m")
+        _HALF_BLOCKS[(top, bottom)] = cell
+    return cell
+
+
+def _rgb_rows(classes, scale):
+    # Each class row becomes an RGB row through one translate per channel, interleaved by
+    # slice assignment; scaling repeats columns the same way and rows by reference
+    for row in classes:
+        row = bytes(row)
+        out = bytearray(3 * scale * len(row))
+        for channel, plane in enumerate(_PLANES):
+            values = row.translate(plane)
+            for k in range(scale):
+                out[3 * k + channel::3 * scale] = values
+        for _ in range(scale):
+            yield out
+
+
+def to_ppm(classes, scale=1):
+    height, width = len(classes) * scale, len(classes[0]) * scale
+    return b"P6\n%d %d\n255\n" % (width, height) + b"".join(_rgb_rows(classes, scale))
+
+
+def to_png(classes, scale=1):
+    height, width = len(classes) * scale, len(classes[0]) * scale
+    raw = b"".join(b"\x00" + bytes(row) for row in _rgb_rows(classes, scale))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def export_image(path, classes, scale=1):
+    """Write class rows to path as PNG, or as PPM when the name ends in .ppm."""
+    data = to_ppm(classes, scale) if path.endswith(".ppm") else to_png(classes, scale)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export overview images of generated maps.")
+    parser.add_argument("--seeds", default="0:10", help="seed or start:stop range")
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--height", type=int, default=300)
+    parser.add_argument("--factor", type=int, default=1)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--format", choices=("png", "ppm"), default="png")
+    parser.add_argument("--out", default="overviews")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    for seed in _parse_seeds(args.seeds):
+        grid, start, exit_pos = generate_map(args.width, args.height, seed=seed)
+        classes = overview(grid, args.factor, exit_pos=exit_pos, player=start)
+        export_image(os.path.join(args.out, f"{seed}.{args.format}"), classes, args.scale)
+
+
+if __name__ == "__main__":
+    main()
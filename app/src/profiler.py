@@ -0,0 +1,126 @@
+"""
+profiler.py
+
+Per-phase frame timing for the interactive game. While enabled, the methods behind each
+phase are wrapped with timers feeding rolling histograms; while disabled the wrappers are
+removed again, so the game runs its plain methods with no profiling cost at all.
+"""
+
+import json
+import time
+from collections import deque
+
+# Phase name -> (object attribute on the game, method name). "idle" is the time spent
+# waiting for the player to press a key, kept apart from the work of a frame.
+PHASES = {
+    "idle": (None, "_wait_for_keys"),
+    "input": (None, "_decode_keys"),
+    "handle_input": (None, "_handle_input"),
+    "reveal": (None, "_reveal_visible_area"),
+    "adversaries": (None, "_move_adversaries"),
+    "speculate": (None, "speculate"),
+    "checks": (None, "_check_end"),
+    "render": ("renderer", "render"),
+}
+LATENCY = "key_to_frame"
+
+
+class Histogram:
+    """The last `window` samples of one measurement, in seconds."""
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.total += 1
+
+    def percentiles(self, *ps):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0] * len(ps)
+        return [ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] for p in ps]
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.total}
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {
+            "count": self.total,
+            "mean_ms": sum(self.samples) / len(self.samples) * 1000,
+            "p50_ms": p50 * 1000,
+            "p95_ms": p95 * 1000,
+            "p99_ms": p99 * 1000,
+            "max_ms": max(self.samples) * 1000,
+        }
+
+
+class FrameProfiler:
+    """
+    Times the game's phases and the delay from a key arriving to the next finished frame.
+
+    enable() installs timing wrappers as instance attributes over the phase methods,
+    disable() deletes them so lookups fall back to the normal methods.
+    """
+    def __init__(self, game, window=1000):
+        self.game = game
+        self.window = window
+        self.histograms = {name: Histogram(window) for name in list(PHASES) + [LATENCY]}
+        self.enabled = False
+        self.key_time = None
+        self._wrapped = []
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        for name, (owner, method) in PHASES.items():
+            target = self.game if owner is None else getattr(self.game, owner)
+            setattr(target, method, self._timed(name, getattr(target, method)))
+            self._wrapped.append((target, method))
+        self.enabled = True
+
+    def disable(self):
+        for target, method in self._wrapped:
+            delattr(target, method)
+        self._wrapped = []
+        self.key_time = None
+        self.enabled = False
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def overlay(self):
+        """One status line: p50/p95/p99 in milliseconds per phase."""
+        parts = []
+        for name, histogram in self.histograms.items():
+            p50, p95, p99 = histogram.percentiles(50, 95, 99)
+            parts.append(f"{name} {p50 * 1000:.2f}/{p95 * 1000:.2f}/{p99 * 1000:.2f}")
+        return "ms p50/p95/p99: " + "  ".join(parts)
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def _timed(self, name, method):
+        histogram = self.histograms[name]
+        latency = self.histograms[LATENCY]
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = method(*args, **kwargs)
+            end = clock()
+            histogram.add(end - start)
+            if name == "input" and result and self.key_time is None:
+                self.key_time = end
+            elif name == "render" and self.key_time is not None:
+                latency.add(end - self.key_time)
+                self.key_time = None
+            return result
+        return timed
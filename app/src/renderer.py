@@ -2,53 +2,212 @@
 renderer.py
 
 Handles all rendering and symbol/color logic for the game map and entities.
+
+Frames are composited in layers: the static map under the fog, cached per block of a row
+and rebuilt only when that block's fog changes, then the trails and the entities drawn
+over it only where they are. The result is a back buffer of (character, color) cells,
+compared with the front buffer, the cells currently on screen. Only changed cells are sent, positioned
+with cursor escapes and colored with one escape per run of same-colored cells, and the
+whole frame goes out in a single write.
 """
 
+import sys
+from collections import OrderedDict
+from minimap import fit_factor, game_overview, halfblock_rows
+from tilemap import EXIT, FLOOR
+
 COLOR_BOLD_RED = '\033[1;31m'
 COLOR_GREEN = '\033[92m'
 COLOR_RESET = '\033[0m'
+PLAIN = ''
+
+CLEAR_SCREEN = '\033[H\033[2J'
+BLANK = (' ', PLAIN)
+PLAYER_CELL = ('†', COLOR_GREEN)
+ADVERSARY_CELL = ('X', COLOR_BOLD_RED)
+PLAYER_TRAIL_CELL = ('·', COLOR_GREEN)
+ADVERSARY_TRAIL_CELL = ('·', COLOR_BOLD_RED)
+EXIT_CELL = ('0', COLOR_BOLD_RED)
+# bytes.translate table turning tile codes into 1 for floor and 0 for anything else
+FLOOR_MASK = bytes(1 if code == FLOOR else 0 for code in range(256))
+# Static map cells are cached in blocks of this many columns of one row
+BLOCK = 64
+# Unchanged cells between two changes are rewritten rather than skipped with a cursor move
+# when the gap is at most this wide, since a move costs about as many bytes
+MERGE_GAP = 6
+
 
 class Renderer:
-    def __init__(self):
-        pass
+    """
+    Differential terminal renderer. sink is any object with write() and flush() (default
+    sys.stdout); tests and benchmarks can pass an in-memory buffer.
+    """
+    def __init__(self, sink=None, block_capacity=4096):
+        self.sink = sink if sink is not None else sys.stdout
+        # Rows of cells as last sent to the terminal; None forces a full redraw
+        self.front = None
+        # (block, y) -> (seen mask, cells) for the static layer, least recently used first
+        self.map = None
+        self.blocks = OrderedDict()
+        self.block_capacity = block_capacity
+
+    def invalidate(self):
+        """Forget what is on screen (other output was printed); the next frame is drawn in full."""
+        self.front = None
+
+    def render(self, game, player, adversaries):
+        """Draw one frame. The exit is drawn from the map's tiles, so it needs no position here."""
+        back = self._compose(game, player, adversaries)
+        self.sink.write(self._diff(back))
+        self.sink.flush()
+        self.front = back
 
-    def render(self, game, player, adversary, exit_pos):
-        os = __import__('os')
-        os.system("cls" if os.name == "nt" else "clear")
-        overlay = f"{game.version}   Tick: {game.tick}   FPS: {int(game.fps)}   Pos: ({player.x}, {player.y})"
-        print(overlay)
+    def _compose(self, game, player, adversaries):
+        rows = [_text(f"{game.version}   Tick: {game.tick}   FPS: {int(game.fps)}   Pos: ({player.x}, {player.y})")]
+
+        vw, vh = game.viewport_width, game.viewport_height
+        if getattr(game, "minimap", False):
+            # Whole-map view in the viewport's place, scaled down to fit
+            lines = halfblock_rows(game_overview(game, fit_factor(game.map.width, game.map.height, vw, vh)))
+            rows.extend(lines)
+            rows.extend([] for _ in range(vh - len(lines)))
+        else:
+            rows.extend(self._compose_view(game, player, adversaries))
+
+        profiler = getattr(game, "profiler", None)
+        if profiler is not None and profiler.enabled:
+            rows.append(_text(profiler.overlay()))
+        else:
+            rows.append(_text("Controls: W/A/S/D = move   . = wait   M = map   P = profiler   Q = quit"))
+        recent_msgs = game.messages[-2:]
+        for msg in recent_msgs:
+            rows.append(_text(msg))
+        for _ in range(2 - len(recent_msgs)):
+            rows.append([])
+        return rows
 
+    def _compose_view(self, game, player, adversaries):
+        rows = []
         px, py = player.x, player.y
         vw, vh = game.viewport_width, game.viewport_height
-        rows, cols = len(game.map), len(game.map[0])
+        tiles = game.map
+        map_rows, cols = tiles.height, tiles.width
         left = max(0, min(px - vw // 2, cols - vw))
-        top = max(0, min(py - vh // 2, rows - vh))
+        top = max(0, min(py - vh // 2, map_rows - vh))
         right = left + vw
         bottom = top + vh
+        if tiles is not self.map:
+            self.map = tiles
+            self.blocks.clear()
 
+        # Entities in view, by row; adversaries only show on seen tiles
+        entities = {}
+        for ax, ay in adversaries.positions:
+            if left <= ax < right and top <= ay < bottom and game.seen.get(ax, ay):
+                entities.setdefault(ay, []).append((ax - left, ADVERSARY_CELL))
+        entities.setdefault(py, []).append((px - left, PLAYER_CELL))
+
+        # Columns of the blocks the view overlaps; one fog mask read per row serves them all
+        span_left = left // BLOCK * BLOCK
+        span_right = min(((right - 1) // BLOCK + 1) * BLOCK, cols)
         for y in range(top, bottom):
-            line = []
-            for x in range(left, right):
-                visible = game.seen[y][x]
-                if (x, y) == (player.x, player.y):
-                    line.append(f"{COLOR_GREEN}†{COLOR_RESET}")
-                elif visible and (x, y) == (adversary.x, adversary.y):
-                    line.append(f"{COLOR_BOLD_RED}X{COLOR_RESET}")
-                elif visible and (x, y) in player.trail and game.map[y][x] == '.':
-                    line.append(f"{COLOR_GREEN}·{COLOR_RESET}")
-                elif visible and (x, y) in adversary.trail and game.map[y][x] == '.':
-                    line.append(f"{COLOR_BOLD_RED}·{COLOR_RESET}")
-                elif visible and (x, y) == exit_pos:
-                    line.append(f"{COLOR_BOLD_RED}0{COLOR_RESET}")
-                elif visible:
-                    line.append(game.map[y][x])
-                else:
-                    line.append(' ')
-            print("".join(line))
-
-        print("Controls: W/A/S/D = move   Q = quit")
-        recent_msgs = game.messages[-2:] if game.messages or False else []
-        for msg in recent_msgs:
-            print(msg)
-        for _ in range(2 - len(recent_msgs)):
-            print()
+            seen_span = game.seen.row_mask(y, span_left, span_right)
+            line = self._base_row(tiles, y, left, right, span_left, seen_span)
+            # Trails show on seen floor tiles; the three masks are combined as big integers
+            # so only the trail tiles that end up drawn are visited one by one
+            seen_bits = int.from_bytes(seen_span[left - span_left:right - span_left], "little")
+            if seen_bits:
+                floor_bits = seen_bits & int.from_bytes(tiles.row_codes(y, left, right).translate(FLOOR_MASK), "little")
+                for trail, cell in ((adversaries.trail, ADVERSARY_TRAIL_CELL), (player.trail, PLAYER_TRAIL_CELL)):
+                    bits = floor_bits & int.from_bytes(trail.row_mask(y, left, right), "little")
+                    if bits:
+                        mask = bits.to_bytes(vw, "little")
+                        i = mask.find(1)
+                        while i != -1:
+                            line[i] = cell
+                            i = mask.find(1, i + 1)
+            for x, cell in entities.get(y, ()):
+                if 0 <= x < len(line):
+                    line[x] = cell
+            rows.append(line)
+        return rows
+
+    def _base_row(self, tiles, y, left, right, span_left, seen_span):
+        # The static layer (tiles under the fog) for columns left..right-1 of row y, as a new
+        # list built from cached blocks; a block is only rebuilt when its fog has changed
+        line = []
+        for bx in range(left // BLOCK, (right - 1) // BLOCK + 1):
+            x0 = bx * BLOCK
+            x1 = min(x0 + BLOCK, tiles.width)
+            seen = seen_span[x0 - span_left:x1 - span_left]
+            key = (bx, y)
+            cached = self.blocks.get(key)
+            if cached is None or cached[0] != seen:
+                cached = self.blocks[key] = (seen, _block_cells(tiles, y, x0, x1, seen))
+                if len(self.blocks) > self.block_capacity:
+                    self.blocks.popitem(last=False)
+            else:
+                self.blocks.move_to_end(key)
+            line += cached[1][max(left, x0) - x0:min(right, x1) - x0]
+        return line
+
+    def _diff(self, back):
+        # Escape sequences that turn the front buffer into back. Terminal rows and columns count from 1.
+        front = self.front
+        out = []
+        if front is None:
+            out.append(CLEAR_SCREEN)
+            front = []
+        color = PLAIN
+        for y, row in enumerate(back):
+            old = front[y] if y < len(front) else []
+            if row == old:
+                continue
+            width = max(len(row), len(old))
+            x = 0
+            while x < width:
+                if _cell(row, x) == _cell(old, x):
+                    x += 1
+                    continue
+                # Extend the run over later changes that are close enough to share one cursor move
+                last = x
+                end = x + 1
+                while end < width and end - last <= MERGE_GAP:
+                    if _cell(row, end) != _cell(old, end):
+                        last = end
+                    end += 1
+                out.append(f"\033[{y + 1};{x + 1}H")
+                for cx in range(x, last + 1):
+                    ch, cell_color = _cell(row, cx)
+                    if cell_color != color:
+                        out.append(COLOR_RESET + cell_color if color else cell_color)
+                        color = cell_color
+                    out.append(ch)
+                x = last + 1
+        for y in range(len(back), len(front)):
+            out.append(f"\033[{y + 1};1H\033[2K")
+        if color:
+            out.append(COLOR_RESET)
+        # Leave the cursor below the frame, where prompts are printed
+        out.append(f"\033[{len(back) + 1};1H")
+        return "".join(out)
+
+
+def _block_cells(tiles, y, x0, x1, seen):
+    cells = []
+    for (code, ch), visible in zip(zip(tiles.row_codes(y, x0, x1), tiles.row(y, x0, x1)), seen):
+        if not visible:
+            cells.append(BLANK)
+        elif code == EXIT:
+            cells.append(EXIT_CELL)
+        else:
+            cells.append((ch, PLAIN))
+    return cells
+
+
+def _text(s):
+    return [(ch, PLAIN) for ch in s]
+
+
+def _cell(row, x):
+    return row[x] if x < len(row) else BLANK
@@ -0,0 +1,232 @@
+"""
+replay.py
+
+Session recordings. Every random choice in a session comes from generators seeded from
+the game seed, so a session is fully determined by its starting state and the player's
+actions. A recording stores one byte per step for the action, plus a keyframe snapshot of
+the whole game every keyframe_interval steps (and at step 0, so sessions resumed from an
+autosave replay too). Each keyframe carries a checksum of the game state, which replays
+compare against to report the first step where a build no longer reproduces a recording.
+
+Usage:
+    python replay.py session.lcrec
+    python replay.py session.lcrec --seek 5000 --verify
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+from bisect import bisect_right
+from engine import RUNNING, GameEngine
+from snapshot import encode_snapshot
+
+MAGIC = b"LCREC\x00\x00\x00"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sHI")
+# Actions record: count, then one action code per step
+_ACTIONS = struct.Struct("<cH")
+# Keyframe record: step, state checksum, snapshot length, then the snapshot
+_KEYFRAME = struct.Struct("<cQII")
+
+ACTION_CODES = {None: 0, "w": 1, "s": 2, "a": 3, "d": 4}
+CODE_ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+
+class ReplayError(ValueError):
+    pass
+
+
+class ReplayDivergence(ReplayError):
+    """Replaying no longer reproduces the recorded state at a keyframe."""
+    def __init__(self, step):
+        super().__init__(f"Replay diverged from the recording by step {step}")
+        self.step = step
+
+
+def state_checksum(game):
+    """
+    CRC of everything that decides how the game continues: positions, modes, trails and
+    random states. Messages are left out, since the interactive game also adds some while
+    handling keys that never reach step().
+    """
+    state = [game.tick, game.status, game.player.x, game.player.y, game.player.steps,
+             game.player_slow_counter, len(game.player.trail), len(game.seen)]
+    for a in game.adversaries:
+        state.append([a.x, a.y, a.mode, a.last_dir, a.locked_on, a.in_hallway, len(a.explored),
+                      list(a.route) if a.route else None, a.rng.getstate()])
+    return zlib.crc32(repr(state).encode())
+
+
+class Recorder:
+    """
+    Records a game's steps to path from its current state on; attaches itself as
+    game.recorder, so GameEngine.step() feeds it and close() finishes the file. An
+    existing recording is never overwritten: the new one goes to the first free name
+    with a -1, -2, ... suffix, kept in self.path.
+    """
+    def __init__(self, path, game, keyframe_interval=1000):
+        self.keyframe_interval = keyframe_interval
+        self.steps = 0
+        self.pending = bytearray()
+        info = json.dumps({"seed": game.seed, "version": getattr(game, "version", None),
+                           "keyframe_interval": keyframe_interval}).encode()
+        self.path, self.file = _create(path)
+        self.file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(info)) + info)
+        self._keyframe(game)
+        game.recorder = self
+
+    def record(self, game, action):
+        self.pending.append(ACTION_CODES[action])
+        self.steps += 1
+        # A finished game is not worth seeking into and would restore as running
+        if self.steps % self.keyframe_interval == 0 and game.status == RUNNING:
+            self._keyframe(game)
+        elif len(self.pending) >= 256:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self.file.close()
+
+    def _keyframe(self, game):
+        self._flush(write=False)
+        snapshot = encode_snapshot(game)
+        self.file.write(_KEYFRAME.pack(b"K", self.steps, state_checksum(game), len(snapshot)) + snapshot)
+        self.file.flush()
+
+    def _flush(self, write=True):
+        # Actions go out in chunks so a crash loses at most the last few steps
+        if self.pending:
+            self.file.write(_ACTIONS.pack(b"A", len(self.pending)) + self.pending)
+            self.pending = bytearray()
+        if write:
+            self.file.flush()
+
+
+def _create(path):
+    # Exclusive creation, so a file appearing between the check and the open is not clobbered
+    root, ext = os.path.splitext(path)
+    n = 0
+    while True:
+        candidate = path if n == 0 else f"{root}-{n}{ext}"
+        try:
+            return candidate, open(candidate, "xb")
+        except FileExistsError:
+            n += 1
+
+
+class Replay:
+    """
+    A recording loaded for playback. len() is the number of recorded steps; game_at(n)
+    returns a headless GameEngine as it was after step n, simulated from the last keyframe
+    at or before n, and verify() checks that the recording still reproduces.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ReplayError("Not a layercake recording")
+        magic, version, info_length = _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ReplayError(f"Unsupported recording version: {version}")
+        offset = _HEADER.size + info_length
+        self.info = json.loads(data[_HEADER.size:offset])
+        self.actions = bytearray()
+        # (step, checksum, snapshot bytes) in step order
+        self.keyframes = []
+        while offset < len(data):
+            tag = data[offset:offset + 1]
+            if tag == b"A" and offset + _ACTIONS.size <= len(data):
+                _, count = _ACTIONS.unpack_from(data, offset)
+                offset += _ACTIONS.size
+                chunk = data[offset:offset + count]
+                offset += count
+                # A chunk cut short by a crash still holds valid steps
+                self.actions += chunk
+            elif tag == b"K" and offset + _KEYFRAME.size <= len(data):
+                _, step, checksum, length = _KEYFRAME.unpack_from(data, offset)
+                offset += _KEYFRAME.size
+                if offset + length > len(data):
+                    break
+                self.keyframes.append((step, checksum, data[offset:offset + length]))
+                offset += length
+            else:
+                break
+        if not self.keyframes:
+            raise ReplayError("Recording has no starting keyframe")
+        self.steps = [step for step, _, _ in self.keyframes]
+
+    def __len__(self):
+        return len(self.actions)
+
+    def action(self, step):
+        """The action taken on step `step` (counting from 1)."""
+        return CODE_ACTIONS[self.actions[step - 1]]
+
+    def game_at(self, step=None):
+        """Restore the last keyframe at or before step (default: the end) and simulate the rest."""
+        if step is None:
+            step = len(self.actions)
+        step = max(0, min(step, len(self.actions)))
+        start, _, snapshot = self.keyframes[bisect_right(self.steps, step) - 1]
+        game = GameEngine.restore(snapshot)
+        for code in self.actions[start:step]:
+            game.step(CODE_ACTIONS[code])
+        return game
+
+    def verify(self):
+        """
+        Replay the whole recording from its first keyframe, checking the state at every
+        later keyframe; raises ReplayDivergence at the first mismatch.
+        """
+        game = GameEngine.restore(self.keyframes[0][2])
+        checks = {s: checksum for s, checksum, _ in self.keyframes}
+        if state_checksum(game) != checks[0]:
+            raise ReplayDivergence(0)
+        for n, code in enumerate(self.actions):
+            game.step(CODE_ACTIONS[code])
+            if n + 1 in checks and state_checksum(game) != checks[n + 1]:
+                raise ReplayDivergence(n + 1)
+        return game
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session headless.")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, default=None, help="stop after this step (default: the end)")
+    parser.add_argument("--verify", action="store_true", help="replay from step 0 and check every keyframe")
+    args = parser.parse_args(argv)
+
+    try:
+        replay = Replay(args.path)
+    except OSError as e:
+        print(f"{args.path}: {e.strerror}")
+        return 2
+    except ReplayError as e:
+        print(f"{args.path}: {e}")
+        return 2
+    start = time.perf_counter()
+    try:
+        if args.verify:
+            game = replay.verify()
+            if args.seek is not None:
+                game = replay.game_at(args.seek)
+        else:
+            game = replay.game_at(args.seek)
+    except ReplayDivergence as e:
+        print(e)
+        return 1
+    elapsed = time.perf_counter() - start
+    print(f"{os.path.basename(args.path)}: seed {replay.info.get('seed')}, {len(replay)} steps, "
+          f"{len(replay.keyframes)} keyframes")
+    print(f"at tick {game.tick}: {game.status}, player at ({game.player.x}, {game.player.y}) "
+          f"[{elapsed:.3f}s]")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,373 @@
+"""
+snapshot.py
+
+Saved games. A snapshot is a small header followed by zlib-compressed sections (tile
+cells, fog and trail bitmaps, trail ages and a JSON block for the small per-entity
+state), so even large maps pack down to a few kilobytes and load without re-generating
+anything. A journal file next to it records one compact delta per tick; replaying it on
+top of the snapshot restores the latest state, so autosave costs a few bytes per tick.
+"""
+
+import json
+import os
+import random
+import struct
+import zlib
+from array import array
+from collections import deque
+from bitmap import Bitmap, SparseBitmap, SummedArea, Trail
+from entities import Player, Adversary, AdversarySwarm
+from tilemap import TileMap
+from world import ChunkedWorld
+
+MAGIC = b"LCSAVE\x00\x00"
+JOURNAL_MAGIC = b"LCJRNL\x00\x00"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sHHIIQ")
+_SECTION = struct.Struct("<4sII")
+_JOURNAL_HEADER = struct.Struct("<8sHQ")
+# Per tick: tick, player x/y, slow counter, adversary count, message count
+_DELTA = struct.Struct("<QiiBIH")
+# Per adversary: x, y, last_dx, last_dy, flags (locked_on, in_hallway), mode
+_ADVERSARY_DELTA = struct.Struct("<iibbBB")
+
+MODES = ("explore", "trail_follow", "frontier")
+FLAG_LOCKED_ON = 1
+FLAG_IN_HALLWAY = 2
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+# What damaged bytes can raise while a save or journal is decoded
+_DECODE_ERRORS = (zlib.error, struct.error, KeyError, IndexError, TypeError, ValueError)
+
+
+def save_snapshot(path, game):
+    """
+    Write game to path, replacing any earlier snapshot atomically. Returns a new, empty
+    Journal for the ticks that follow; the previous journal is superseded.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_snapshot(game))
+    os.replace(tmp_path, path)
+    return Journal(journal_path(path), game.tick, len(game.messages))
+
+
+def encode_snapshot(game):
+    """The snapshot of game as bytes, as save_snapshot writes it."""
+    sections = [(b"META", json.dumps(_meta(game), separators=(",", ":")).encode())]
+    # Chunked worlds are rebuilt from their seed and parameters instead of being stored
+    if not isinstance(game.map, ChunkedWorld):
+        sections.append((b"TILE", b"".join(game.map.row_codes(y) for y in range(game.map.height))))
+    sections.append((b"SEEN", _pack_bitmap(game.seen)))
+    sections.append((b"PTRL", _pack_bitmap(game.player.trail.bits)))
+    sections.append((b"PAGE", _pack_ages(game.player.trail)))
+    sections.append((b"RTRL", _pack_bitmap(game.adversaries.trail.bits)))
+    sections.append((b"RAGE", _pack_ages(game.adversaries.trail)))
+    for adversary in game.adversaries:
+        sections.append((b"EXPL", _pack_bitmap(adversary.explored)))
+        sections.append((b"ARNG", _pack_rng(adversary.rng)))
+
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), game.map.width, game.map.height, game.tick)]
+    for tag, data in sections:
+        packed = zlib.compress(data, 6)
+        parts.append(_SECTION.pack(tag, len(data), len(packed)))
+        parts.append(packed)
+    return b"".join(parts)
+
+
+def load_snapshot(path, game):
+    """
+    Fill a bare Game instance (created without __init__) from a snapshot, then replay its
+    journal if there is one. Terminal-facing setup is left to the caller.
+    """
+    with open(path, "rb") as f:
+        decode_snapshot(f.read(), game)
+    journal = journal_path(path)
+    if os.path.exists(journal):
+        try:
+            replay_journal(journal, game)
+        except SnapshotError:
+            raise
+        except _DECODE_ERRORS as e:
+            raise SnapshotError("Journal file is corrupt") from e
+    return game
+
+
+def decode_snapshot(data, game):
+    """Fill a bare Game instance from snapshot bytes made by encode_snapshot."""
+    if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+        raise SnapshotError("Not a layercake save file")
+    magic, version, count, width, height, tick = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported save file version: {version}")
+    try:
+        return _decode_sections(data, game, count, width, height, tick)
+    except SnapshotError:
+        raise
+    except _DECODE_ERRORS as e:
+        raise SnapshotError("Save file is corrupt") from e
+
+
+def _decode_sections(data, game, count, width, height, tick):
+    sections = {}
+    offset = _HEADER.size
+    for _ in range(count):
+        if offset + _SECTION.size > len(data):
+            raise SnapshotError("Save file is truncated")
+        tag, raw_length, packed_length = _SECTION.unpack_from(data, offset)
+        offset += _SECTION.size
+        raw = zlib.decompress(data[offset:offset + packed_length])
+        if len(raw) != raw_length:
+            raise SnapshotError("Save file is corrupt")
+        sections.setdefault(tag, []).append(raw)
+        offset += packed_length
+
+    meta = json.loads(sections[b"META"][0])
+    world = meta["world"]
+    if world is not None:
+        game.map = ChunkedWorld(width, height, **world)
+    else:
+        game.map = TileMap(width, height)
+        tiles = sections[b"TILE"][0]
+        for y in range(height):
+            start = game.map.index(0, y)
+            game.map.cells[start:start + width] = tiles[y * width:(y + 1) * width]
+    game.exit_pos = tuple(meta["exit_pos"])
+    game.seed = meta["seed"]
+    game.tick = tick
+    game.messages = meta["messages"]
+    game.player_slow_counter = meta["player_slow_counter"]
+    game.seen = _unpack_bitmap(sections[b"SEEN"][0], width, height)
+    game.sight_radius = meta["sight_radius"]
+    game.visible = set()
+
+    player = meta["player"]
+    game.player = Player(player["x"], player["y"])
+    game.player.steps = player["steps"]
+    game.player.trail = game.player.explored = _unpack_trail(
+        sections[b"PTRL"][0], sections[b"PAGE"][0], width, height, player["trail"])
+
+    swarm = meta["adversaries"]
+    red_trail = _unpack_trail(sections[b"RTRL"][0], sections[b"RAGE"][0], width, height, swarm["trail"])
+    adversaries = []
+    rngs = [_unpack_rng(data) for data in sections[b"ARNG"]]
+    if not len(swarm["members"]) == len(sections[b"EXPL"]) == len(rngs):
+        raise SnapshotError("Save file is corrupt")
+    for state, explored, rng in zip(swarm["members"], sections[b"EXPL"], rngs):
+        adversary = Adversary(state["x"], state["y"], state["vision_radius"], search_limit=state["search_limit"],
+                              rng=rng)
+        adversary.trail = red_trail
+        adversary.explored = _unpack_bitmap(explored, width, height)
+        adversary.mode = state["mode"]
+        adversary.last_dir = tuple(state["last_dir"])
+        adversary.locked_on = state["locked_on"]
+        adversary.in_hallway = state["in_hallway"]
+        adversary.rebuild_frontier(game.map)
+        if state["route"]:
+            adversary.route = deque(tuple(pos) for pos in state["route"])
+        adversaries.append(adversary)
+    game.adversaries = AdversarySwarm(adversaries, red_trail)
+    game.adversary = game.adversaries[0]
+    return game
+
+
+def journal_path(path):
+    return path + ".journal"
+
+
+class Journal:
+    """
+    Append-only per-tick log of what changed since the snapshot it belongs to.
+
+    Each record holds the positions and small flags of every entity plus any new
+    messages; trails, fog and explored tiles follow from the positions, so they are
+    re-derived on replay instead of being written out.
+    """
+    def __init__(self, path, base_tick, message_count=0):
+        self.path = path
+        self.base_tick = base_tick
+        self.file = open(path, "wb")
+        self.file.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION, base_tick))
+        self.file.flush()
+        self.message_count = message_count
+
+    def record(self, game):
+        messages = game.messages[self.message_count:]
+        self.message_count = len(game.messages)
+        parts = [_DELTA.pack(game.tick, game.player.x, game.player.y, game.player_slow_counter,
+                             len(game.adversaries), len(messages))]
+        for adversary in game.adversaries:
+            flags = (FLAG_LOCKED_ON if adversary.locked_on else 0) | (FLAG_IN_HALLWAY if adversary.in_hallway else 0)
+            parts.append(_ADVERSARY_DELTA.pack(adversary.x, adversary.y, adversary.last_dir[0], adversary.last_dir[1],
+                                               flags, MODES.index(adversary.mode)))
+        for msg in messages:
+            encoded = msg.encode("utf-8")
+            parts.append(struct.pack("<H", len(encoded)) + encoded)
+        record = b"".join(parts)
+        # Length-prefixed so a record cut short by a crash is recognised and dropped on replay
+        self.file.write(struct.pack("<I", len(record)) + record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def replay_journal(path, game):
+    """Apply every complete record in a journal to a game restored from its snapshot."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _JOURNAL_HEADER.size:
+        return
+    magic, version, base_tick = _JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC or version != FORMAT_VERSION:
+        raise SnapshotError("Not a layercake journal file")
+    if base_tick != game.tick:
+        # Left over from an earlier snapshot (a crash between writing the two files)
+        return
+    tiles = game.map
+    player = game.player
+    offset = _JOURNAL_HEADER.size
+    while offset + 4 <= len(data):
+        (length,) = struct.unpack_from("<I", data, offset)
+        if offset + 4 + length > len(data):
+            break
+        pos = offset + 4
+        offset = pos + length
+        tick, px, py, slow, count, message_count = _DELTA.unpack_from(data, pos)
+        pos += _DELTA.size
+        if (px, py) != (player.x, player.y):
+            player.x, player.y = px, py
+            player.trail.add((px, py))
+            player.steps += 1
+            game._reveal_visible_area()
+        game.player_slow_counter = slow
+        for adversary in game.adversaries.adversaries[:count]:
+            ax, ay, ldx, ldy, flags, mode = _ADVERSARY_DELTA.unpack_from(data, pos)
+            pos += _ADVERSARY_DELTA.size
+            if (ax, ay) != (adversary.x, adversary.y):
+                adversary._visit(tiles, ax, ay)
+            adversary.last_dir = (ldx, ldy)
+            adversary.locked_on = bool(flags & FLAG_LOCKED_ON)
+            adversary.in_hallway = bool(flags & FLAG_IN_HALLWAY)
+            adversary.mode = MODES[mode]
+        for _ in range(message_count):
+            (size,) = struct.unpack_from("<H", data, pos)
+            game.messages.append(data[pos + 2:pos + 2 + size].decode("utf-8"))
+            pos += 2 + size
+        game.tick = tick
+    game.adversaries.positions = {(a.x, a.y) for a in game.adversaries}
+
+
+def _meta(game):
+    tiles = game.map
+    world = None
+    if isinstance(tiles, ChunkedWorld):
+        world = {
+            "seed": tiles.seed, "chunk_size": tiles.chunk_size, "cache_size": tiles.cache_size,
+            "room_min": tiles.room_min, "room_max": tiles.room_max, "rooms_per_chunk": tiles.rooms_per_chunk,
+        }
+    player = game.player
+    return {
+        "world": world,
+        "seed": game.seed,
+        "exit_pos": game.exit_pos,
+        "messages": game.messages,
+        "player_slow_counter": game.player_slow_counter,
+        "sight_radius": game.sight_radius,
+        "player": {"x": player.x, "y": player.y, "steps": player.steps, "trail": _trail_meta(player.trail)},
+        "adversaries": {
+            "trail": _trail_meta(game.adversaries.trail),
+            "members": [
+                {
+                    "x": a.x, "y": a.y, "mode": a.mode, "last_dir": a.last_dir, "locked_on": a.locked_on,
+                    "in_hallway": a.in_hallway, "vision_radius": a.vision_radius, "search_limit": a.search_limit,
+                    "route": list(a.route) if a.route else None,
+                }
+                for a in game.adversaries
+            ],
+        },
+    }
+
+
+def _trail_meta(trail):
+    return {
+        "summed": isinstance(trail.bits, Bitmap) and trail.bits.summed is not None,
+        "ages": trail.ages is not None,
+        "decay": trail.decay,
+        "clock": trail.clock,
+    }
+
+
+def _pack_bitmap(bitmap):
+    if isinstance(bitmap, Bitmap):
+        return b"B" + bytes(bitmap.bits)
+    parts = [b"S", struct.pack("<I", bitmap.page_size)]
+    for (px, py), page in bitmap.pages.items():
+        parts.append(struct.pack("<ii", px, py))
+        parts.append(bytes(page.bits))
+    return b"".join(parts)
+
+
+def _unpack_bitmap(data, width, height, summed=False):
+    if data[:1] == b"B":
+        bitmap = Bitmap(width, height)
+        bitmap.bits[:] = data[1:]
+        bitmap.population = int.from_bytes(bitmap.bits, "little").bit_count()
+        if summed:
+            bitmap.summed = SummedArea(bitmap)
+        return bitmap
+    (page_size,) = struct.unpack_from("<I", data, 1)
+    bitmap = SparseBitmap(width, height, page_size)
+    page_bytes = ((page_size + 7) >> 3) * page_size
+    offset = 5
+    while offset < len(data):
+        px, py = struct.unpack_from("<ii", data, offset)
+        page = Bitmap(page_size, page_size)
+        page.bits[:] = data[offset + 8:offset + 8 + page_bytes]
+        page.population = int.from_bytes(page.bits, "little").bit_count()
+        bitmap.pages[(px, py)] = page
+        bitmap.population += page.population
+        offset += 8 + page_bytes
+    return bitmap
+
+
+def _pack_rng(rng):
+    # Mersenne Twister state: 624 words plus the position in them
+    version, words, gauss = rng.getstate()
+    return array("I", words).tobytes()
+
+
+def _unpack_rng(data):
+    rng = random.Random()
+    rng.setstate((3, tuple(array("I", data)), None))
+    return rng
+
+
+def _pack_ages(trail):
+    if trail.ages is None:
+        return b""
+    if trail.dense:
+        return trail.ages.tobytes()
+    return b"".join(struct.pack("<iiI", x, y, stamp) for (x, y), stamp in trail.ages.items())
+
+
+def _unpack_trail(bits, ages, width, height, meta):
+    trail = Trail(_unpack_bitmap(bits, width, height, meta["summed"]), meta["ages"], meta["decay"])
+    trail.clock = meta["clock"]
+    if trail.ages is None:
+        return trail
+    if trail.dense:
+        trail.ages = array('I')
+        trail.ages.frombytes(ages)
+    else:
+        for x, y, stamp in struct.iter_unpack("<iiI", ages):
+            trail.ages[(x, y)] = stamp
+    if trail.marks is not None:
+        # Only the latest mark of each tile matters for expiry, so rebuild the queue from the ages
+        trail.marks.extend(sorted((trail.stamp(x, y), (x, y)) for x, y in trail))
+    return trail
@@ -0,0 +1,118 @@
+"""
+spatial.py
+
+Uniform-grid spatial index over rooms, used by map generation for overlap rejection
+and nearest-room queries without scanning every placed room.
+"""
+
+
+class RoomIndex:
+    """
+    Buckets rooms by the grid cells their rectangles cover, and room centers by the
+    cell they fall in. With a cell size near the largest room, a room touches at most
+    four buckets, so overlap tests and nearest-center lookups stay close to O(1).
+    """
+    def __init__(self, cell_size):
+        self.cell_size = max(1, cell_size)
+        self.rooms = []
+        self.room_buckets = {}
+        self.center_buckets = {}
+        self.min_cell = None
+        self.max_cell = None
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def add(self, room):
+        order = len(self.rooms)
+        self.rooms.append(room)
+        x, y, w, h = room
+        for key in self._covered_cells(x, y, x + w - 1, y + h - 1):
+            self.room_buckets.setdefault(key, []).append(room)
+        cx, cy = x + w // 2, y + h // 2
+        key = (cx // self.cell_size, cy // self.cell_size)
+        self.center_buckets.setdefault(key, []).append((order, cx, cy, room))
+        if self.min_cell is None:
+            self.min_cell, self.max_cell = key, key
+        else:
+            self.min_cell = (min(self.min_cell[0], key[0]), min(self.min_cell[1], key[1]))
+            self.max_cell = (max(self.max_cell[0], key[0]), max(self.max_cell[1], key[1]))
+
+    def overlaps(self, room, padding=1):
+        x, y, w, h = room
+        checked = set()
+        for key in self._covered_cells(x - padding, y - padding, x + w - 1 + padding, y + h - 1 + padding):
+            for other in self.room_buckets.get(key, ()):
+                if other in checked:
+                    continue
+                checked.add(other)
+                if _rooms_overlap(room, other, padding):
+                    return True
+        return False
+
+    def nearest(self, pos):
+        """Room whose center is closest to pos (Manhattan), ties going to the earliest added room."""
+        order = self.nearest_index(pos)
+        return None if order is None else self.rooms[order]
+
+    def nearest_index(self, pos):
+        if not self.rooms:
+            return None
+        px, py = pos
+        size = self.cell_size
+        qx, qy = px // size, py // size
+        # Rings beyond this radius cannot contain any center
+        max_ring = max(
+            abs(qx - self.min_cell[0]), abs(qx - self.max_cell[0]),
+            abs(qy - self.min_cell[1]), abs(qy - self.max_cell[1]),
+        )
+        best = None
+        ring = 0
+        while ring <= max_ring:
+            for key in _ring_cells(qx, qy, ring):
+                for order, cx, cy, room in self.center_buckets.get(key, ()):
+                    candidate = (abs(px - cx) + abs(py - cy), order)
+                    if best is None or candidate < best:
+                        best = candidate
+            # Centers in later rings are more than ring * size tiles away on some axis
+            if best is not None and best[0] <= ring * size:
+                break
+            ring += 1
+        return best[1]
+
+    def centers_near(self, pos, rings=1):
+        """(order, cx, cy) for every room center within `rings` grid cells of pos."""
+        qx, qy = pos[0] // self.cell_size, pos[1] // self.cell_size
+        for ring in range(rings + 1):
+            for key in _ring_cells(qx, qy, ring):
+                for order, cx, cy, _ in self.center_buckets.get(key, ()):
+                    yield order, cx, cy
+
+    def _covered_cells(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for gy in range(y1 // size, y2 // size + 1):
+            for gx in range(x1 // size, x2 // size + 1):
+                yield (gx, gy)
+
+
+def _ring_cells(qx, qy, ring):
+    if ring == 0:
+        yield (qx, qy)
+        return
+    for gx in range(qx - ring, qx + ring + 1):
+        yield (gx, qy - ring)
+        yield (gx, qy + ring)
+    for gy in range(qy - ring + 1, qy + ring):
+        yield (qx - ring, gy)
+        yield (qx + ring, gy)
+
+
+def _rooms_overlap(r1, r2, padding=1):
+    x1, y1, w1, h1 = r1
+    x2, y2, w2, h2 = r2
+    return (
+        x1 - padding < x2 + w2 and
+        x1 + w1 + padding > x2 and
+        y1 - padding < y2 + h2 and
+        y1 + h1 + padding > y2
+    )
@@ -0,0 +1,82 @@
+"""
+terminal.py
+
+Keyboard input for the interactive game. The terminal is switched to cbreak mode once
+for the whole session (not per key), and keys are read without blocking the game loop:
+whatever has been typed is drained in one batch whenever the loop asks.
+"""
+
+import os
+import sys
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import selectors
+    import termios
+    import tty
+
+
+class KeyReader:
+    """
+    Context manager owning the terminal for a session.
+
+    read(timeout) waits at most timeout seconds (None = until a key arrives, 0 = not at
+    all) and returns every key typed so far as a string, possibly empty. It raises
+    EOFError once input is closed. wait() and drain() are its two halves, for callers
+    that time the waiting apart from the reading.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.saved = None
+        self.selector = None
+
+    def __enter__(self):
+        if os.name != "nt":
+            self.fd = self.stream.fileno()
+            if os.isatty(self.fd):
+                self.saved = termios.tcgetattr(self.fd)
+                # cbreak rather than raw: keys arrive one at a time, but output still
+                # translates newlines and Ctrl-C still interrupts
+                tty.setcbreak(self.fd)
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.fd, selectors.EVENT_READ)
+        return self
+
+    def __exit__(self, *exc):
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+        if self.saved is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved)
+            self.saved = None
+        return False
+
+    def read(self, timeout=None):
+        if not self.wait(timeout):
+            return ""
+        return self.drain()
+
+    def wait(self, timeout=None):
+        """Block up to timeout seconds (None = forever) for a key; True once one is waiting."""
+        if os.name == "nt":
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not msvcrt.kbhit():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.005)
+            return True
+        return bool(self.selector.select(timeout))
+
+    def drain(self):
+        """Every key typed so far, after wait() returned True."""
+        if os.name == "nt":
+            keys = []
+            while msvcrt.kbhit():
+                keys.append(msvcrt.getwch())
+            return "".join(keys)
+        data = os.read(self.fd, 1024)
+        if not data:
+            raise EOFError("Input closed")
+        return data.decode("utf-8", "ignore")
@@ -0,0 +1,60 @@
+"""
+tileclass.py
+
+Static per-tile classification of a finished map. Maps never change after generation,
+so whether a floor tile is a dead end, hallway, junction or open room floor, and how far
+a hallway runs in each direction, is computed once instead of by probing neighbors
+every tick.
+"""
+
+from array import array
+from tilemap import FLOOR
+
+NOT_FLOOR = 0
+DEAD_END = 1
+HALLWAY = 2
+JUNCTION = 3
+OPEN = 4
+
+# Direction order matches TileMap.neighbor_offsets: east, west, south, north
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class TileClasses:
+    """
+    Per-tile class and hallway run lengths for a TileMap, indexed like its cells.
+
+    A tile's class is its number of floor neighbors (DEAD_END..OPEN). runs[d][i] is
+    how many steps one can keep walking in direction d from tile i while standing on
+    dead-end or hallway tiles, i.e. the distance to the next decision point.
+    """
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        cells = tile_map.cells
+        offsets = tile_map.neighbor_offsets
+        data = bytes(cells)
+        self.classes = classes = bytearray(len(data))
+        floor = []
+        i = data.find(FLOOR)
+        while i != -1:
+            floor.append(i)
+            # The wall border keeps every neighbor probe in range; a lone floor tile counts as a dead end
+            neighbors = sum(data[i + offset] == FLOOR for offset in offsets)
+            classes[i] = max(neighbors, DEAD_END)
+            i = data.find(FLOOR, i + 1)
+        self.runs = [array('H', bytes(2 * len(cells))) for _ in offsets]
+        # A run from i continues from i + offset, so fill each direction in the order that
+        # visits i + offset before i: descending indices for east/south, ascending for west/north
+        for d, offset in enumerate(offsets):
+            run = self.runs[d]
+            order = reversed(floor) if offset > 0 else floor
+            for i in order:
+                if classes[i] <= HALLWAY and data[i + offset] == FLOOR:
+                    run[i] = min(run[i + offset] + 1, 0xFFFF)
+
+    def in_hallway(self, x, y):
+        return NOT_FLOOR < self.classes[self.tile_map.index(x, y)] <= HALLWAY
+
+    def run_length(self, x, y, direction):
+        """Steps available from (x, y) in direction (dx, dy) before the next decision point."""
+        return self.runs[DIRECTIONS.index(direction)][self.tile_map.index(x, y)]
@@ -0,0 +1,181 @@
+"""
+tilemap.py
+
+Compact tile map storage. Tiles are one-byte codes in a flat bytearray surrounded by a
+one-tile wall border, so neighbor probes from any in-map tile never need bounds checks.
+"""
+
+from array import array
+
+WALL = 0
+FLOOR = 1
+EXIT = 2
+
+TILE_SYMBOLS = {WALL: '#', FLOOR: '.', EXIT: '>'}
+SYMBOL_TILES = {'#': WALL, '.': FLOOR, '>': EXIT}
+
+# bytes.translate table turning a run of tile codes into display characters
+TILE_CHARS = bytes.maketrans(bytes(TILE_SYMBOLS), ''.join(TILE_SYMBOLS.values()).encode())
+# bytes.translate table turning tile codes into 1 for walkable tiles and 0 for walls
+OPEN_MASK = bytes(0 if code == WALL else 1 for code in range(256))
+
+
+class TileMap:
+    """
+    Width x height grid of tile codes, stored row-major with a wall border.
+
+    Coordinates are map coordinates (0..width-1, 0..height-1); the border makes
+    x == -1, x == width, y == -1 and y == height valid wall reads. Indexing
+    (tile_map[y][x]) returns the old one-character symbols for legacy callers.
+    """
+    def __init__(self, width, height, fill=WALL):
+        self.width = width
+        self.height = height
+        self.stride = width + 2
+        self.cells = bytearray(self.stride * (height + 2))
+        # Flat-index offsets of the four orthogonal neighbors
+        self.neighbor_offsets = (1, -1, self.stride, -self.stride)
+        if fill != WALL:
+            self.fill_rect(0, 0, width, height, fill)
+
+    def index(self, x, y):
+        return (y + 1) * self.stride + x + 1
+
+    def position(self, i):
+        y, x = divmod(i, self.stride)
+        return x - 1, y - 1
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        return self.cells[(y + 1) * self.stride + x + 1]
+
+    def set(self, x, y, tile):
+        self.cells[(y + 1) * self.stride + x + 1] = tile
+
+    def is_floor(self, x, y):
+        return self.cells[(y + 1) * self.stride + x + 1] == FLOOR
+
+    def is_open(self, x, y):
+        return self.cells[(y + 1) * self.stride + x + 1] != WALL
+
+    def fill_rect(self, x, y, w, h, tile=FLOOR):
+        run = bytes((tile,)) * w
+        start = self.index(x, y)
+        for row_start in range(start, start + h * self.stride, self.stride):
+            self.cells[row_start:row_start + w] = run
+
+    def hline(self, x1, x2, y, tile=FLOOR):
+        lo, hi = min(x1, x2), max(x1, x2)
+        start = self.index(lo, y)
+        self.cells[start:start + hi - lo + 1] = bytes((tile,)) * (hi - lo + 1)
+
+    def vline(self, y1, y2, x, tile=FLOOR):
+        lo, hi = min(y1, y2), max(y1, y2)
+        start = self.index(x, lo)
+        n = hi - lo + 1
+        self.cells[start:start + n * self.stride:self.stride] = bytes((tile,)) * n
+
+    def row_codes(self, y, x0=0, x1=None):
+        if x1 is None:
+            x1 = self.width
+        start = (y + 1) * self.stride + 1
+        return bytes(self.cells[start + x0:start + x1])
+
+    def row_bytes(self, y, x0=0, x1=None):
+        return self.row_codes(y, x0, x1).translate(TILE_CHARS)
+
+    def row(self, y, x0=0, x1=None):
+        return self.row_bytes(y, x0, x1).decode('ascii')
+
+    def rows(self):
+        return [self.row(y) for y in range(self.height)]
+
+    def count(self, tile):
+        return bytes(self.cells).count(tile)
+
+    def label_components(self):
+        """
+        Label the 4-connected regions of open tiles in one pass over the cells.
+
+        Returns (labels, count): labels is an array indexed like self.cells holding
+        0 for walls and 1..count for open tiles; two tiles are mutually reachable
+        exactly when their labels are equal.
+        """
+        open_mask = bytes(self.cells).translate(OPEN_MASK)
+        labels = array('I', bytes(4 * len(open_mask)))
+        offsets = self.neighbor_offsets
+        count = 0
+        i = open_mask.find(1)
+        while i != -1:
+            if not labels[i]:
+                count += 1
+                labels[i] = count
+                stack = [i]
+                while stack:
+                    j = stack.pop()
+                    for d in offsets:
+                        n = j + d
+                        if open_mask[n] and not labels[n]:
+                            labels[n] = count
+                            stack.append(n)
+            i = open_mask.find(1, i + 1)
+        return labels, count
+
+    @classmethod
+    def from_buffer(cls, width, height, cells):
+        """Wrap an existing padded cell buffer (bytearray, memoryview of an mmap) without copying."""
+        if len(cells) != (width + 2) * (height + 2):
+            raise ValueError("Cell buffer does not match map dimensions")
+        tile_map = cls.__new__(cls)
+        tile_map.width = width
+        tile_map.height = height
+        tile_map.stride = width + 2
+        tile_map.cells = cells
+        tile_map.neighbor_offsets = (1, -1, tile_map.stride, -tile_map.stride)
+        return tile_map
+
+    @classmethod
+    def from_rows(cls, rows):
+        tile_map = cls(len(rows[0]), len(rows))
+        for y, row in enumerate(rows):
+            for x, ch in enumerate(row):
+                tile_map.set(x, y, SYMBOL_TILES[ch])
+        return tile_map
+
+    # Compatibility view: tile_map[y][x] reads and writes symbols like the old list-of-lists grid
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.height:
+            raise IndexError(y)
+        return _RowView(self, y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield _RowView(self, y)
+
+
+class _RowView:
+    """One row of a TileMap, indexed by x, yielding display symbols."""
+    def __init__(self, tile_map, y):
+        self.tile_map = tile_map
+        self.y = y
+
+    def __len__(self):
+        return self.tile_map.width
+
+    def __getitem__(self, x):
+        if not 0 <= x < self.tile_map.width:
+            raise IndexError(x)
+        return TILE_SYMBOLS[self.tile_map.get(x, self.y)]
+
+    def __setitem__(self, x, symbol):
+        if not 0 <= x < self.tile_map.width:
+            raise IndexError(x)
+        self.tile_map.set(x, self.y, SYMBOL_TILES[symbol])
+
+    def __iter__(self):
+        return iter(self.tile_map.row(self.y))
@@ -34,10 +34,3 @@ def get_version():
     except Exception:
         pass
     return "version unknown"
-
-def is_open_tile(game_map, x, y):
-    return 0 <= y < len(game_map) and 0 <= x < len(game_map[0]) and game_map[y][x] in ('.', '>')
-
-def is_floor(game_map, x, y):
-    return 0 <= y < len(game_map) and 0 <= x < len(game_map[0]) and game_map[y][x] == '.'
-
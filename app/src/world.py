@@ -0,0 +1,160 @@
+"""
+world.py
+
+Chunked world: a very large map generated lazily, one fixed-size chunk at a time, so
+startup cost and memory depend on what has been visited rather than on width x height.
+"""
+
+import random
+from collections import OrderedDict
+from mapgen import carve_corridor, room_center
+from spatial import RoomIndex
+from tilemap import TILE_CHARS, WALL, FLOOR, EXIT, TileMap
+
+
+class ChunkedWorld:
+    """
+    Map made of chunk_size x chunk_size TileMap chunks.
+
+    A chunk is generated from (seed, chunk_x, chunk_y) the first time any tile in
+    it is read, and is rebuilt identically if it has been evicted from the LRU
+    cache in the meantime. Each shared chunk edge has one door whose offset is
+    derived from the edge alone, so both chunks carve a corridor to the same
+    tile and the world stays connected across chunk boundaries.
+
+    Exposes the same read interface as TileMap (width, height, in_bounds,
+    is_floor, is_open, get, row_codes, row_bytes, row).
+    """
+    def __init__(self, width, height, seed, chunk_size=64, cache_size=64,
+                 room_min=4, room_max=10, rooms_per_chunk=4):
+        if chunk_size < room_max + 4:
+            raise ValueError("chunk_size must leave room for the largest room and its border")
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self.room_min = room_min
+        self.room_max = room_max
+        self.rooms_per_chunk = rooms_per_chunk
+        self.chunks_x = -(-width // chunk_size)
+        self.chunks_y = -(-height // chunk_size)
+        self.width = self.chunks_x * chunk_size
+        self.height = self.chunks_y * chunk_size
+        self.cache = OrderedDict()
+        self.generated = 0
+        self._last_key = None
+        self._last_chunk = None
+
+        rng = random.Random(f"{seed}:world")
+        self.start_chunk = (self.chunks_x // 2, self.chunks_y // 2)
+        self.exit_chunk = (rng.choice((0, self.chunks_x - 1)), rng.choice((0, self.chunks_y - 1)))
+        self.player_start = self._chunk_anchor(*self.start_chunk)
+        self.exit_pos = self._chunk_anchor(*self.exit_chunk)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return WALL
+        cx, lx = divmod(x, self.chunk_size)
+        cy, ly = divmod(y, self.chunk_size)
+        return self.chunk(cx, cy).get(lx, ly)
+
+    def is_floor(self, x, y):
+        return self.get(x, y) == FLOOR
+
+    def is_open(self, x, y):
+        return self.get(x, y) != WALL
+
+    def row_codes(self, y, x0=0, x1=None):
+        if x1 is None:
+            x1 = self.width
+        cy, ly = divmod(y, self.chunk_size)
+        return b''.join(self.chunk(cx, cy).row_codes(ly, lx0, lx1) for cx, lx0, lx1 in self._row_spans(x0, x1))
+
+    def row_bytes(self, y, x0=0, x1=None):
+        return self.row_codes(y, x0, x1).translate(TILE_CHARS)
+
+    def row(self, y, x0=0, x1=None):
+        return self.row_bytes(y, x0, x1).decode('ascii')
+
+    def chunk(self, cx, cy):
+        key = (cx, cy)
+        if key == self._last_key:
+            return self._last_chunk
+        chunk = self.cache.get(key)
+        if chunk is None:
+            chunk = self._generate_chunk(cx, cy)
+            self.cache[key] = chunk
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        self._last_key, self._last_chunk = key, chunk
+        return chunk
+
+    def _row_spans(self, x0, x1):
+        size = self.chunk_size
+        x = x0
+        while x < x1:
+            cx, lx = divmod(x, size)
+            end = min(x1, (cx + 1) * size)
+            yield cx, lx, lx + end - x
+            x = end
+
+    def _chunk_anchor(self, cx, cy):
+        # World position of the first room center in a chunk
+        rooms = self._place_rooms(random.Random(f"{self.seed}:chunk:{cx}:{cy}"))
+        x, y = room_center(rooms[0])
+        return cx * self.chunk_size + x, cy * self.chunk_size + y
+
+    def _place_rooms(self, rng):
+        size = self.chunk_size
+        room_index = RoomIndex(self.room_max + 2)
+        for _ in range(self.rooms_per_chunk):
+            w = rng.randint(self.room_min, self.room_max)
+            h = rng.randint(self.room_min, self.room_max)
+            room = (rng.randint(2, size - w - 2), rng.randint(2, size - h - 2), w, h)
+            if not room_index.overlaps(room):
+                room_index.add(room)
+        if not room_index.rooms:
+            # Fall back to a hub in the middle so every chunk has somewhere to connect doors
+            half = self.room_min // 2
+            room_index.add((size // 2 - half, size // 2 - half, self.room_min, self.room_min))
+        return room_index.rooms
+
+    def _edge_door(self, axis, ex, ey):
+        # Offset along the shared edge; only depends on the edge, never on which side asks
+        return random.Random(f"{self.seed}:door:{axis}:{ex}:{ey}").randint(2, self.chunk_size - 3)
+
+    def _generate_chunk(self, cx, cy):
+        size = self.chunk_size
+        rng = random.Random(f"{self.seed}:chunk:{cx}:{cy}")
+        tiles = TileMap(size, size)
+        rooms = self._place_rooms(rng)
+        for i, room in enumerate(rooms):
+            x, y, w, h = room
+            tiles.fill_rect(x, y, w, h, FLOOR)
+            if i:
+                carve_corridor(tiles, room_center(rooms[i - 1]), room_center(room), rng)
+
+        hub = room_center(rooms[0])
+        doors = []
+        if cx > 0:
+            doors.append(((0, self._edge_door('v', cx, cy)), (1, 0)))
+        if cx < self.chunks_x - 1:
+            doors.append(((size - 1, self._edge_door('v', cx + 1, cy)), (-1, 0)))
+        if cy > 0:
+            doors.append(((self._edge_door('h', cx, cy), 0), (0, 1)))
+        if cy < self.chunks_y - 1:
+            doors.append(((self._edge_door('h', cx, cy + 1), size - 1), (0, -1)))
+        for (dx, dy), (ix, iy) in doors:
+            # Step one tile inward first so the corridor never runs along the chunk edge
+            inner = (dx + ix, dy + iy)
+            tiles.set(dx, dy, FLOOR)
+            carve_corridor(tiles, inner, hub, rng)
+
+        if (cx, cy) == self.exit_chunk:
+            tiles.set(hub[0], hub[1], EXIT)
+        self.generated += 1
+        return tiles